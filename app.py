@@ -1,18 +1,34 @@
 from bot.RIbot import RetailBot
+from bot.exports import stream_csv, stream_xlsx
+from bot.charts import chart_cache, deferred_charts, resolve_chart, start_renderer
+from bot.fleet_analytics import FleetAnalytics
+from bot.parcel import start_parcel_pool, stream_parcel_zip, template_bytes
+from bot.artifacts import ArtifactStore
+from bot.jobs import JobQueue, STATUS_DONE, STATUS_FAILED
+from bot.tracing import recent_traces, span
+from bot.db import TimedConnection, query_log
+from bot import metrics
 import pandas as pd
 import os
 import sqlite3
-from flask import Flask, render_template, request, jsonify, send_from_directory, send_file, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_from_directory, send_file, session, redirect, url_for, Response, stream_with_context
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from datetime import date, timedelta
 import io
-import matplotlib.pyplot as plt
+import json
 import base64
+import logging
 
 
+# Debug output (matcher scores, queries, raw replies) shows with RI_LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.environ.get("RI_LOG_LEVEL", "WARNING").upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
 bot = RetailBot()
+start_renderer()
+start_parcel_pool()
 
 app = Flask(__name__)
 
@@ -29,8 +45,11 @@ app.config.update(
     PERMANENT_SESSION_LIFE = timedelta(hours=1)
 )
 
+artifacts = ArtifactStore(DB_PATH)
+artifacts.start_sweeper()
+
 def db_connect():
-    conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA busy_timeout=5000;")
@@ -101,37 +120,150 @@ def logout():
 def index():
     return render_template("index.html")
 
+def run_chat(payload, chart_mode=None):
+    """Send a /chat payload (message or form_data) to the bot and return its raw response."""
+    user_role = session.get("role", "user")
+    user_input = (payload.get("message") or "").strip()
+    form_data = payload.get("form_data")
+
+    logger.debug("Chat from %s (%s): input=%r form=%s", session.get("username"), user_role, user_input, form_data)
+
+    with span("chat", path=request.path, role=user_role) as root:
+        if form_data:
+            root.set(intent=f"form:{form_data.get('form_id')}")
+            response = bot.handle_form_submission(form_data, role=user_role)
+        else:
+            response = bot.process_input(user_input, role=user_role, chart_mode=chart_mode)
+
+    logger.debug("Bot response: %s", response)
+    return response
+
+def stored_file_reply(response, username, request_text):
+    """Generated files go to the artifact store; the reply carries a download link instead."""
+    if not (isinstance(response, dict) and response.get("file")):
+        return response
+
+    key = artifacts.put(response["file"], response["filename"], username=username, request=request_text)
+    return {
+        "text": response.get("text") or f"{response['filename']} is ready.",
+        # Built by hand: background jobs call this outside any request context
+        "download": f"/download/{key}",
+        "filename": response["filename"],
+    }
+
+def store_file_reply(response, payload):
+    form_data = payload.get("form_data")
+    request_text = json.dumps(form_data) if form_data else (payload.get("message") or "").strip()
+    return stored_file_reply(response, session.get("username"), request_text)
+
+def job_result(result, job):
+    return stored_file_reply(result, job["username"], job["description"])
+
+# Forecasts, history charts and parcel shippers run as background jobs unless RI_BACKGROUND_JOBS=0
+if os.environ.get("RI_BACKGROUND_JOBS", "1") != "0":
+    bot.jobs = JobQueue(DB_PATH, result_hook=job_result, current_user=lambda: session.get("username"))
+
 @app.route("/chat", methods=["POST"])
 @login_required
 def chat():
-    print("Flask: Received a request")
-
-    user_role = session.get("role", "user")
-    print(f"User role: {user_role}")
+    payload = request.json
+    chart_mode = payload.get("chart_mode")
+
+    response = run_chat(payload, chart_mode)
+    if isinstance(response, dict) and "chart_spec" in response:
+        with span("chart", path=request.path):
+            resolve_chart(response, chart_mode)
+    response = store_file_reply(response, payload)
+    return jsonify({"reply": response})
 
-    
-    user_input = (request.json.get("message") or "").strip()
-    form_data = request.json.get("form_data")
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-    print("User input:", user_input)
-    print(f"Form data: {form_data}")
+@app.route("/chat/stream", methods=["POST"])
+@login_required
+def chat_stream():
+    """
+    /chat as server-sent events. Events, in order:
+      status  sent immediately so the client knows the request is being worked on
+      reply   the reply, same shape as /chat's "reply"; data-mode charts are already in it
+      chart   {"image": url} (or {"chart_note": ...} if it failed), once a PNG chart is rendered
+      done
+
+    Forecasts and history charts run as background jobs (unless RI_BACKGROUND_JOBS=0):
+    their reply event is a job handle ({"text", "job"}) and no chart event follows.
+    The job renders its chart itself, so the client polls /jobs/<id> and gets the
+    text together with the chart's URL (or points) as soon as the job is done.
+    """
+    payload = request.get_json(silent=True) or {}
+    chart_mode = payload.get("chart_mode")
+
+    def generate():
+        yield sse_event("status", {"state": "working"})
+        try:
+            # PNG charts come back as a spec and are rendered once the text has been sent
+            with deferred_charts():
+                response = run_chat(payload, chart_mode)
+            spec_pending = isinstance(response, dict) and "chart_spec" in response
+            chart_spec = response.pop("chart_spec") if spec_pending else None
+            yield sse_event("reply", store_file_reply(response, payload))
+
+            if chart_spec is not None:
+                with span("chart", path=request.path):
+                    fields = resolve_chart({"chart_spec": chart_spec}, chart_mode)
+                yield sse_event("chart", fields)
+        except Exception as e:
+            logger.exception("Stream error: %s", e)
+            yield sse_event("error", {"text": "⚠ Something went wrong"})
+        yield sse_event("done", {})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    if form_data:
-        print(f"Processing form submission: {form_data.get('form_id')}")
-        response = bot.handle_form_submission(form_data, role=user_role)
-    else:
-        response = bot.process_input(user_input, role=user_role)
+def visible_job(job_id):
+    """The job if it exists and belongs to the current user (admins see every job)."""
+    job = bot.jobs.get(job_id) if bot.jobs else None
+    if job is None:
+        return None
+    if job["username"] and job["username"] != session.get("username") and session.get("role") != "admin":
+        return None
+    return job
 
-    
-    print("Bot Response:", response)
-    
-    if isinstance(response, dict) and response.get("file"):
-        return send_file(
-            response["file"],
-            as_attachment=True,
-            download_name=response["filename"]
-        )
-    return jsonify({"reply": response})
+@app.route("/jobs/<job_id>")
+@login_required
+def job_status(job_id):
+    """Status of a background job, with its reply once it is done."""
+    job = visible_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify({
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "description": job["description"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+        "result": job["result"],
+    })
+
+@app.route("/jobs/<job_id>/result")
+@login_required
+def job_reply(job_id):
+    """A finished job's reply in /chat's shape; 202 while it is still queued or running."""
+    job = visible_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == STATUS_FAILED:
+        return jsonify({"error": job["error"]}), 500
+    if job["status"] != STATUS_DONE:
+        return jsonify({"status": job["status"]}), 202
+
+    return jsonify({"reply": job["result"]})
 
 @app.route("/admin/users/new", methods=["GET", "POST"])
 @login_required
@@ -181,7 +313,7 @@ def list_users():
             ORDER BY username
         """)
         users = cur.fetchall()
-    print("DB_PATH:", DB_PATH, "User count:", len(users))
+    logger.debug("DB_PATH: %s, user count: %d", DB_PATH, len(users))
 
     return render_template("users.html", users=users)
 
@@ -201,11 +333,143 @@ def reset_password(user_id):
     conn.close()
     return redirect(url_for("list_users"))
 
+@app.route("/admin/export/<any(inventory, retailers):table>")
+@login_required
+@role_required("admin")
+def export_table(table):
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in ("csv", "xlsx"):
+        return jsonify({"error": "format must be csv or xlsx"}), 400
+
+    def generate():
+        # Own connection so a long export doesn't hold the bot's shared one
+        conn = db_connect()
+        try:
+            if fmt == "xlsx":
+                yield from stream_xlsx(conn, table)
+            else:
+                yield from stream_csv(conn, table)
+        finally:
+            conn.close()
+
+    mimetype = (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        if fmt == "xlsx" else "text/csv"
+    )
+    filename = f"{table}_{date.today().isoformat()}.{fmt}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+@app.route("/admin/analytics/<any(top, drops, inactive):report>")
+@login_required
+@role_required("admin")
+def fleet_analytics(report):
+    """JSON versions of the fleet scan reports, e.g. /admin/analytics/drops?pct=40"""
+    conn = db_connect()
+    try:
+        fleet = FleetAnalytics(conn)
+        if report == "top":
+            df = fleet.top_retailers(request.args.get("n", 10, type=int))
+        elif report == "drops":
+            df = fleet.scan_drops(request.args.get("pct", 50, type=float), request.args.get("trailing", 3, type=int))
+        else:
+            df = fleet.inactive_retailers(request.args.get("months", 3, type=int))
+    finally:
+        conn.close()
+    return jsonify({"report": report, "rows": df.to_dict(orient="records")})
+
+@app.route("/admin/traces")
+@login_required
+@role_required("admin")
+def traces():
+    """Recent chat traces, newest first, e.g. /admin/traces?min_ms=500&intent=scan_forecast"""
+    return jsonify({"traces": recent_traces(
+        limit=request.args.get("limit", 50, type=int),
+        min_ms=request.args.get("min_ms", 0, type=float),
+        intent=request.args.get("intent"),
+    )})
+
+@app.route("/admin/metrics")
+@login_required
+@role_required("admin")
+def metrics_text():
+    """Counters and latency histograms in Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/troubleshooting/reload", methods=["POST"])
+@login_required
+@role_required("admin")
+def reload_troubleshooting():
+    """Re-read troubleshooting answers and flows after they are edited; clears cached replies."""
+    answers, flows = bot.reload_troubleshooting()
+    return jsonify({"answers": answers, "flows": flows, "data_version": bot.data_version})
+
+@app.route("/admin/queries")
+@login_required
+@role_required("admin")
+def slow_queries():
+    """Statement shapes by total time, their captured query plans, and recent slow statements."""
+    order = request.args.get("order", "total_ms")
+    if order not in ("total_ms", "max_ms", "avg_ms", "count", "slow"):
+        order = "total_ms"
+    shapes = query_log.shapes(order)
+    slow = query_log.slow_statements()
+    if request.args.get("format") == "json":
+        return jsonify({"threshold_ms": query_log.threshold * 1000, "shapes": shapes, "slow": slow})
+    return render_template("queries.html", shapes=shapes, slow=slow, order=order, threshold_ms=query_log.threshold * 1000)
+
+@app.route("/charts/<key>.png")
+@login_required
+def chart_image(key):
+    # Charts are content-addressed, so the key is a strong ETag and the image never changes
+    if request.if_none_match.contains(key):
+        return Response(status=304, headers={"ETag": f'"{key}"', "Cache-Control": "private, max-age=31536000, immutable"})
+
+    png = chart_cache.get(key)
+    if png is None:
+        return "Chart not found", 404
+
+    resp = Response(png, mimetype="image/png")
+    resp.set_etag(key)
+    resp.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return resp
+
+@app.route("/parcel/bulk", methods=["POST"])
+@login_required
+def parcel_bulk():
+    """
+    Many parcel shippers in one ZIP, streamed as they are generated. Body:
+    {"shipments": [{"retailer": "...", "shipping_method": "Ground", "use_equipment_on_file": true, "manual_items": null}, ...]}
+    manifest.csv in the ZIP records each retailer's status and generation time.
+    """
+    shipments = (request.get_json(silent=True) or {}).get("shipments")
+    if not isinstance(shipments, list) or not shipments:
+        return jsonify({"error": "shipments must be a non-empty list"}), 400
+    if template_bytes() is None:
+        return jsonify({"error": "Parcel shipper file not found."}), 404
+
+    jobs = bot.parcel_jobs(shipments)
+    filename = f"parcel_shippers_{date.today().strftime('%Y%m%d')}.zip"
+    return Response(
+        stream_with_context(stream_parcel_zip(jobs)),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
 @app.route("/download/<filename>")
 @login_required
 def download_file(filename):
+    stored = artifacts.get(filename)
+    if stored:
+        path, download_name, mimetype = stored
+        return send_file(path, as_attachment=True, download_name=download_name, mimetype=mimetype, etag=filename)
+
+    # Files generated before the artifact store
     safe = secure_filename(filename)
-    return send_from_directory("generated", filename, as_attachment=True)
+    return send_from_directory("generated", safe, as_attachment=True)
 
 @app.route("/autocomplete_retailer")
 @login_required
@@ -0,0 +1,102 @@
+"""
+Time and peak memory for listing a full inventory.
+
+"before" reproduces the old path: fetchall() of sqlite3.Row objects mapped through
+a per-row hasattr(row, "keys") branch into a regular (dict-backed) record class.
+"after" streams InventoryManager.iter_devices(), which builds slotted Device
+records straight from the cursor via device_row_factory.
+
+    python benchmarks/bench_device_listing.py --devices 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Optional
+
+from bench_utils import create_inventory_db
+
+from bot.inventory import DEVICE_COLUMNS, InventoryManager
+
+
+@dataclass
+class LegacyDevice:
+    id: int
+    type: str
+    number: Optional[str]
+    serial_number: str
+    model: Optional[str]
+    ios_version: Optional[str]
+    status: str
+    last_updated: Optional[str]
+    asset_tag: Optional[str]
+    location: Optional[str]
+    assigned_to: Optional[str]
+    notes: Optional[str]
+
+
+def legacy_row_to_device(row):
+    if hasattr(row, "keys"):
+        return LegacyDevice(
+            id=int(row["id"]),
+            type=str(row["type"]),
+            number=row["number"],
+            serial_number=str(row["serial_number"]),
+            model=row["model"],
+            ios_version=row["ios_version"],
+            status=str(row["status"] or "").strip() or "in_house",
+            last_updated=str(row["last_updated"]) if row["last_updated"] is not None else None,
+            asset_tag=row["asset_tag"],
+            location=row["location"],
+            assigned_to=row["assigned_to"],
+            notes=row["notes"],
+        )
+    raise TypeError("bench only feeds sqlite3.Row")
+
+
+def list_before(conn):
+    cur = conn.cursor()
+    cur.execute(f"SELECT {DEVICE_COLUMNS} FROM inventory ORDER BY id")
+    return [legacy_row_to_device(r) for r in cur.fetchall()]
+
+
+def list_after(inv):
+    return inv.iter_devices()
+
+
+def measure(label, fn, consume):
+    # Time and memory are separate passes: tracemalloc slows allocation-heavy code a lot
+    t0 = time.perf_counter()
+    n = consume(fn())
+    elapsed = time.perf_counter() - t0
+
+    tracemalloc.start()
+    consume(fn())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<26} devices={n:>7}  time={elapsed * 1000:>8.1f} ms  peak={peak / 1024 / 1024:>7.2f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = create_inventory_db(os.path.join(tmp, "bench_listing.db"), args.devices)
+        inv = InventoryManager(conn)
+
+        # Count in-house devices: the same work for both paths
+        def count_in_house(devices):
+            return sum(1 for d in devices if d.status == "in_house")
+
+        measure("before (list + Row map)", lambda: list_before(conn), count_in_house)
+        measure("after (iter_devices)", lambda: list_after(inv), count_in_house)
+        measure("after, materialized", lambda: list(list_after(inv)), count_in_house)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
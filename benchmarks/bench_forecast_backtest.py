@@ -0,0 +1,153 @@
+"""
+Rolling-origin backtest of the forecasting engines in bot/forecasters.py.
+
+Replays scan_events history: at each origin month the engines only see the months
+up to and including the origin and forecast the next --horizon months, which are
+then compared with what actually happened. Retailers are split into chunks that
+run in a process pool, one strategy at a time.
+
+Reported per strategy:
+  MAE / MAPE      over every (retailer, origin, month ahead); MAPE skips zero months
+  wall s          end-to-end time for the strategy across the pool
+  fit+predict s   time spent inside Forecaster.forecast, summed over workers
+                  (the engines fit and predict in one call)
+  peak MiB        largest tracemalloc peak of a single forecast call in any worker
+
+Uses a synthetic dataset by default; point --db at a copy of retailers.db (or an
+anonymized export of scan_events) to backtest on real history.
+
+    python benchmarks/bench_forecast_backtest.py --retailers 500 --months 48
+    python benchmarks/bench_forecast_backtest.py --db retailers_copy.db --strategy rolling --strategy holt_winters
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from bench_utils import create_scan_events_db
+
+from bot import forecasters
+from bot.scan_pred import ScanPredictor
+
+
+def rolling_origins(n_months, horizon, n_origins, step):
+    """Origin column indexes, latest last; each leaves `horizon` months of actuals after it."""
+    last = n_months - 1 - horizon
+    origins = [last - i * step for i in range(n_origins)]
+    return sorted(o for o in origins if o >= 0)
+
+
+def _forecast_at(forecaster, counts, lengths, months, origin, horizon):
+    """Forecast the months after `origin` from the history up to it. Returns (rows, predictions)."""
+    seen = lengths - (counts.shape[1] - 1 - origin)
+    rows = seen > 0
+    history = counts[rows, :origin + 1]
+    today = months[origin] + pd.DateOffset(months=1)  # the origin month has just finished
+    preds = forecaster.forecast(history, seen[rows], origin + 1, horizon, months[origin], today=today)
+    return rows, preds
+
+
+def _backtest_worker(strategy, counts, lengths, months, origins, horizon):
+    forecaster = forecasters.ENGINES[strategy]()
+    abs_err = ape = 0.0
+    n_points = n_ape = 0
+    elapsed = 0.0
+
+    for origin in origins:
+        t0 = time.perf_counter()
+        rows, preds = _forecast_at(forecaster, counts, lengths, months, origin, horizon)
+        elapsed += time.perf_counter() - t0
+
+        actual = counts[rows, origin + 1:origin + 1 + horizon]
+        err = np.abs(preds - actual)
+        abs_err += err.sum()
+        n_points += err.size
+        nonzero = actual > 0
+        ape += (err[nonzero] / actual[nonzero]).sum()
+        n_ape += int(nonzero.sum())
+
+    # Separate pass for memory: tracemalloc slows allocation-heavy code too much to time under it
+    tracemalloc.start()
+    _forecast_at(forecaster, counts, lengths, months, origins[-1], horizon)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return abs_err, n_points, ape, n_ape, elapsed, peak
+
+
+def run_strategy(pool, strategy, matrix, origins, horizon, chunks):
+    t0 = time.perf_counter()
+    futures = [
+        pool.submit(_backtest_worker, strategy, matrix.counts[idx], matrix.lengths[idx], matrix.months, origins, horizon)
+        for idx in chunks
+    ]
+    results = [f.result() for f in futures]
+    wall = time.perf_counter() - t0
+
+    abs_err, n_points, ape, n_ape, elapsed, _ = (sum(col) for col in zip(*results))
+    peak = max(r[5] for r in results)
+    return {
+        "strategy": strategy,
+        "mae": abs_err / max(n_points, 1),
+        "mape": 100 * ape / max(n_ape, 1),
+        "wall": wall,
+        "fit_predict": elapsed,
+        "peak": peak / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="existing database with scan_events (default: synthetic)")
+    parser.add_argument("--retailers", type=int, default=500, help="synthetic retailers")
+    parser.add_argument("--months", type=int, default=48, help="synthetic months of history")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--horizon", type=int, default=3, help="months forecast at each origin")
+    parser.add_argument("--origins", type=int, default=6, help="number of rolling origins")
+    parser.add_argument("--step", type=int, default=2, help="months between origins")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--strategy", action="append", choices=sorted(forecasters.ENGINES),
+                        help="strategies to compare (repeatable, default: all available)")
+    args = parser.parse_args()
+
+    strategies = args.strategy or [
+        name for name in forecasters.ENGINES
+        if name != forecasters.ProphetForecaster.name or forecasters.Prophet is not None
+    ]
+    if forecasters.ProphetForecaster.name in strategies and forecasters.Prophet is None:
+        parser.error("prophet is not installed")
+
+    # Backtest on complete months only
+    end_month = ScanPredictor.forecast_start() - pd.DateOffset(months=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.db:
+            conn = sqlite3.connect(args.db)
+        else:
+            conn = create_scan_events_db(os.path.join(tmp, "bench_backtest.db"), args.retailers, args.months, end_month, args.seed)
+        matrix = ScanPredictor(conn).monthly_matrix(end_month=end_month)
+        conn.close()
+
+    origins = rolling_origins(matrix.counts.shape[1], args.horizon, args.origins, args.step)
+    if not origins:
+        parser.error("not enough history for that horizon")
+
+    chunks = [c for c in np.array_split(np.arange(len(matrix.keys)), args.workers * 4) if len(c)]
+    print(f"{len(matrix.keys)} retailers, {matrix.counts.shape[1]} months, "
+          f"{len(origins)} origins x {args.horizon} months ahead, {args.workers} workers\n")
+    print(f"{'strategy':<16} {'MAE':>7} {'MAPE':>8} {'wall s':>8} {'fit+predict s':>14} {'peak MiB':>9}")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for strategy in strategies:
+            r = run_strategy(pool, strategy, matrix, origins, args.horizon, chunks)
+            print(f"{r['strategy']:<16} {r['mae']:>7.2f} {r['mape']:>7.1f}% {r['wall']:>8.2f} "
+                  f"{r['fit_predict']:>14.3f} {r['peak']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
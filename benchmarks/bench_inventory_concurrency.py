@@ -0,0 +1,97 @@
+"""
+Hammer inventory check-outs from many threads and report throughput and double-assignments.
+
+Every thread tries to check out every device, so each device must end up
+checked out exactly once. "legacy" replays the old read-then-write path
+(lookup_device, status check in Python, unconditional UPDATE) for comparison;
+"conditional" uses InventoryManager.check_out.
+
+    python benchmarks/bench_inventory_concurrency.py --devices 200 --threads 16
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from bench_utils import connect, create_inventory_db
+
+from bot.inventory import STATUS_ASSIGNED, STATUS_IN_HOUSE, InventoryManager
+
+
+def legacy_check_out(inv, code, assigned_to):
+    dev = inv.lookup_device(code)
+    if not dev or dev.status != STATUS_IN_HOUSE:
+        return False
+    inv.conn.execute(
+        "UPDATE inventory SET status = ?, assigned_to = ?, last_updated = CURRENT_TIMESTAMP WHERE id = ?",
+        (STATUS_ASSIGNED, assigned_to, dev.id),
+    )
+    inv.conn.commit()
+    return True
+
+
+def run(mode, db_path, n_devices, n_threads):
+    setup = create_inventory_db(db_path, n_devices)
+    InventoryManager(setup)  # run schema migrations once, before the threads race
+    setup.close()
+    codes = [f"A{i:06d}" for i in range(n_devices)]
+    wins = Counter()
+    lock = threading.Lock()
+    attempts = [0]
+    start_gate = threading.Barrier(n_threads)
+
+    def worker(name):
+        conn = connect(db_path)
+        inv = InventoryManager(conn)
+        order = codes[:]
+        random.shuffle(order)
+        start_gate.wait()
+        mine = []
+        for code in order:
+            if mode == "legacy":
+                ok = legacy_check_out(inv, code, name)
+            else:
+                ok, _ = inv.check_out(code, name)
+            if ok:
+                mine.append(code)
+        with lock:
+            wins.update(mine)
+            attempts[0] += len(order)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(f"worker-{i}",)) for i in range(n_threads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    doubles = sum(1 for c in wins.values() if c > 1)
+    missing = n_devices - len(wins)
+    print(
+        f"{mode:<12} attempts={attempts[0]:>7}  {attempts[0] / elapsed:>9.0f} ops/s  "
+        f"checked_out={len(wins):>6}  double_assigned={doubles:>5}  never_assigned={missing}"
+    )
+    return doubles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--mode", choices=["legacy", "conditional", "both"], default="both")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench_inventory.db")
+        modes = ["legacy", "conditional"] if args.mode == "both" else [args.mode]
+        for mode in modes:
+            run(mode, db_path, args.devices, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Shared helpers for the benchmark scripts in this folder.
+Run the scripts from the repo root, e.g. `python benchmarks/bench_inventory_concurrency.py`.
+"""
+import os
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+INVENTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inventory (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    number TEXT,
+    serial_number TEXT NOT NULL,
+    model TEXT,
+    ios_version TEXT,
+    status TEXT,
+    last_updated TEXT,
+    asset_tag TEXT,
+    location TEXT,
+    assigned_to TEXT,
+    notes TEXT
+)
+"""
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA busy_timeout=30000;")
+    return conn
+
+
+def create_inventory_db(path, n_devices):
+    """Fresh inventory table with n_devices in-house iPads (asset tags A000000...)."""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = connect(path)
+    conn.execute(INVENTORY_SCHEMA)
+    conn.executemany(
+        """
+        INSERT INTO inventory (type, number, serial_number, model, status, last_updated, asset_tag, location)
+        VALUES ('iPad', ?, ?, 'iPad 10th Gen', 'in_house', CURRENT_TIMESTAMP, ?, 'HQ')
+        """,
+        ((f"iPad-{i}", f"SN{i:07d}", f"A{i:06d}") for i in range(n_devices)),
+    )
+    conn.commit()
+    return conn
+
+
+SCAN_EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    retailer TEXT NOT NULL,
+    scan_date TEXT NOT NULL
+)
+"""
+
+
+def create_scan_events_db(path, n_retailers, n_months, end_month, seed=0):
+    """
+    Fresh scan_events table with synthetic monthly activity for n_retailers over the
+    n_months ending at end_month: a mix of steady, seasonal, growing, new and
+    churned retailers, Poisson counts around each one's monthly rate.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = connect(path)
+    conn.execute(SCAN_EVENTS_SCHEMA)
+
+    rng = np.random.default_rng(seed)
+    months = pd.date_range(end=pd.Timestamp(end_month), periods=n_months, freq="MS")
+    t = np.arange(n_months)
+
+    def events():
+        for r in range(n_retailers):
+            base = rng.lognormal(mean=1.0, sigma=0.8)
+            season = base * rng.uniform(0, 0.6) * np.sin(2 * np.pi * (t + rng.integers(12)) / 12)
+            trend = base * rng.normal(0, 0.015) * t
+            rate = np.clip(base + season + trend, 0, None)
+
+            start = rng.integers(n_months - 3) if rng.random() < 0.25 else 0
+            rate[:start] = 0
+            if rng.random() < 0.1:  # churned: goes quiet partway through
+                rate[rng.integers(start + 1, n_months):] = 0
+
+            for month, count in zip(months, rng.poisson(rate)):
+                for day in rng.integers(0, month.days_in_month, size=count):
+                    yield f"Retailer {r:05d}", (month + pd.Timedelta(days=int(day))).strftime("%Y-%m-%d")
+
+    conn.executemany("INSERT INTO scan_events (retailer, scan_date) VALUES (?, ?)", events())
+    conn.commit()
+    return conn
@@ -5,16 +5,27 @@ from bot.bot_matchers import find_best_row, find_best_column, parse_requested_co
 from bot.bot_utils import *
 from bot.scan_pred import ScanPredictor
 from bot.scan_history import ScanHistory
+from bot.fleet_analytics import FleetAnalytics
+from bot.scan_alerts import ScanAnomalyDetector
+from bot.parcel import PARCEL_TEMPLATE, fill_parcel_shipper, shipment_text
+from bot.charts import chart_response, with_chart
+from bot.response_cache import RESPONSE_CACHE_ITEMS, ResponseCache, normalize_message
+from bot.db import TimedConnection
+from bot.metrics import MATCH_SCORE
+from bot.tracing import annotate, set_intent, traced
 from bot.flow_engine import FlowEngine
 from bot.inventory import InventoryManager
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import sqlite3
+import contextvars
 import inspect
-from openpyxl import load_workbook
+import logging
 import os
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 #Confidence Threasholds
 RETAILER_HIGH = 70
 RETAILER_MEDIUM = 40
@@ -23,9 +34,18 @@ COLUMN_MEDIUM = 0.60
 TROUBLE_THREASHOLD = 0.40
 
 MAX_INFO_TURNS = 3
+
+# Intents whose replies depend only on the message, the role and retailer/troubleshooting data
+CACHEABLE_INTENTS = {"retailer_info", "troubleshooting", "troubleshooting_list", "help"}
+
+# Intent of the message being handled. The bot is shared by every request thread, so
+# this lives in the request's context rather than on the instance.
+_routed_intent = contextvars.ContextVar("ri_routed_intent", default=None)
+
 class RetailBot:
     def __init__(self, db_path="retailers.db"):
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, factory=TimedConnection)
         self.conn.row_factory = sqlite3.Row
         cursor = self.conn.cursor()
         
@@ -63,16 +83,23 @@ class RetailBot:
 
         self.predictor = ScanPredictor(self.conn)
         self.scan_history = ScanHistory(self.conn)
+        self.fleet = FleetAnalytics(self.conn)
+        self.scan_alerts = ScanAnomalyDetector(self.conn)
+
+        # Set by the app to a bot.jobs.JobQueue to run forecasts, charts and shippers in the background
+        self.jobs = None
 
         self.active_scan_entry = False
 
         self.inventory = InventoryManager(self.conn)
+
+        # Bumped on every retailer/troubleshooting write; part of the response cache key
+        self.data_version = 0
+        self.responses = ResponseCache() if RESPONSE_CACHE_ITEMS > 0 else None
         
 
 
-        self.df_trouble['clean_question'] = self.df_trouble['question'].astype(str).apply(clean_text_tfidf)
-        self.vectorizer_trouble = TfidfVectorizer(ngram_range=(1, 2))
-        self.tfidf_trouble = self.vectorizer_trouble.fit_transform(self.df_trouble['clean_question'])
+        self.index_troubleshooting()
         self.column_names = list(column_aliases.keys())
         column_docs = [" ".join([col] + column_aliases.get(col, [])) for col in self.column_names]
         self.intent_vectorizer = TfidfVectorizer(ngram_range=(1, 2))
@@ -82,13 +109,42 @@ class RetailBot:
             self.tfidf_columns = None
 
 
-    def process_input(self, user_input, role="user"):
-        """Handles yes/no confirmation in Flask"""
+    @traced()
+    def process_input(self, user_input, role="user", chart_mode=None):
+        """
+        Reply to a chat message. Replies to read-only intents asked with no
+        conversation in progress come from the response cache when possible.
+        """
         user_input = str(user_input).strip()
+        token = _routed_intent.set(None)
+        try:
+            cacheable = self.responses is not None and not self.has_pending_state()
+            if cacheable:
+                key = (normalize_message(user_input), role, self.data_version)
+                cached = self.responses.get(key)
+                annotate(response_cache="hit" if cached is not None else "miss")
+                if cached is not None:
+                    intent, response = cached
+                    self.routed(intent)
+                    return response
+
+            response = self.route_input(user_input, role, chart_mode)
+
+            # A handler may have started a conversation (e.g. "did you mean ...?"); that reply can't be reused
+            intent = _routed_intent.get()
+            if cacheable and intent in CACHEABLE_INTENTS and not self.has_pending_state():
+                self.responses.put(key, (intent, response))
+            return response
+        finally:
+            _routed_intent.reset(token)
+
+    def route_input(self, user_input, role="user", chart_mode=None):
+        """Handles yes/no confirmation in Flask"""
 
 #------ Handle forms for inventory management ------------------------------------------------------------------------        
         if user_input.startswith("open_form "):
             form_id = user_input.split(" ", 1)[1].strip()
+            self.routed("inventory_form")
 
             if form_id == "inventory_add_device":
                 return {"reply": self.inventory.add_device_form()}
@@ -98,64 +154,101 @@ class RetailBot:
                 return {"reply": self.inventory.checkout_form()}
             if form_id == "inventory_checkin":
                 return {"reply": self.inventory.checkin_form()}
+            if form_id == "inventory_batch_checkout":
+                return {"reply": self.inventory.batch_checkout_form()}
+            if form_id == "inventory_batch_checkin":
+                return {"reply": self.inventory.batch_checkin_form()}
+            if form_id == "inventory_device_history":
+                return {"reply": self.inventory.device_history_form()}
+            if form_id == "inventory_received":
+                return {"reply": self.inventory.devices_received_form()}
 
         if is_inventory_request(user_input):
+            self.routed("inventory")
             return {"reply": self.inventory.dashboard_form(is_admin=(role == "admin"))}
         
         if "update retailer" in user_input.lower():
+            self.routed("update_retailer_form")
             return {"reply": self.update_retailer_form()}
 
 #------- Confirmations and Pending States ---------------------------------------------------------------------------------       
         scan_form_response = self.handle_scan_entry_input(user_input)
         if scan_form_response:
+            self.routed("scan_entry")
             return scan_form_response
 
         if self.active_scan_entry:
+            self.routed("scan_entry")
             return self.handle_scan_entry_mode(user_input)
         
         flow_resume = self.resume_flow_with_retailer(user_input)
         if flow_resume:
+            self.routed("troubleshooting_flow")
             return flow_resume
         
         flow_response = self.handle_flows(user_input)
         if flow_response:
+            self.routed("troubleshooting_flow")
             return flow_response
         
         if self.is_known_troubleshooting_request(user_input):
+            self.routed("troubleshooting_list")
             return self.list_known_troubleshooting()
         
         if is_retailer_info_question(user_input):
+            self.routed("retailer_info")
             return self.handle_retailer_input(user_input)
         
         trouble_answer = self.get_troubleshooting_answer(user_input)
         if trouble_answer:
+            self.routed("troubleshooting")
             return trouble_answer
         
         if user_input in ["help", "h", "?"]:
+            self.routed("help")
             return self.handel_help()
         
         if is_retailer_info_question(user_input):
+            self.routed("retailer_info")
             return self.handle_retailer_input(user_input)
 
         if self.awaiting_confirmation:
+            self.routed("confirmation")
             self.awaiting_confirmation_turns += 1
             return self.handle_confirmation(user_input)
         
         if self.awaiting_multi_info:
+            self.routed("retailer_info")
             return self.get_mutliple_info(user_input)
                 
         if self.awaiting_shipping:
+            self.routed("shipping")
             self.awaiting_shipping_turns += 1
             return self.handle_shipping_input(user_input)
         
         if self.awaiting_retailer:
+            self.routed("retailer_info")
             return self.handle_retailer_input(user_input)
         
 #------ Parcel Shipper Flow -------------------------------------------        
         if self.awaiting_parcel:
+            self.routed("parcel_shipper")
             return self.handle_parcel_flow(user_input)
+
+#------ Device history (after the pending states, so a reply mid-conversation isn't taken as a lookup) ----
+        history_code = extract_device_history_code(user_input)
+        if history_code:
+            self.routed("device_history")
+            return self.inventory.format_device_history(history_code)
+
+        receiver = extract_device_receiver(user_input)
+        if receiver:
+            self.routed("devices_received")
+            _, retailer, _ = find_best_row(receiver, self.df_customer_info, threshold=RETAILER_HIGH)
+            return self.inventory.format_devices_received(retailer or receiver)
         
         if is_parcel_shipper_request(user_input):
+            self.routed("parcel_shipper")
             row_index, retailer, score = find_best_row(
                 user_input, self.df_customer_info, threshold=60
             )
@@ -175,15 +268,18 @@ class RetailBot:
 #------- Update Intent -----------------------------------------------------
         
         if detect_multiple_updates(user_input) or is_note_addition(user_input):
+            self.routed("update")
             return self.handle_multi_update(user_input, author="Bot")
         
 #------- Equipment -----------------------------------------------------------
         
         if self.pending_action == "new_equipment" and self.new_ipad is None:
+            self.routed("new_equipment")
             self.new_ipad = user_input
             return "What is the new sensor serial?"
 
         if self.pending_action == "new_equipment" and self.new_sensor is None:
+            self.routed("new_equipment")
             self.new_sensor = user_input
 
             row_index, retailer, score = find_best_row(self.last_user_input, self.df_customer_info)
@@ -196,6 +292,7 @@ class RetailBot:
             return f"New equipment saved for {retailer} and old equipment moved to returning."
 
         if any(x in user_input.lower() for x in ["new equipment", "update equipment", "replace equipment", "send new equipment"]):
+            self.routed("new_equipment")
             self.pending_action = "new_equipment"
             self.last_user_input = user_input
             self.new_ipad = None
@@ -203,27 +300,55 @@ class RetailBot:
             return "What is the new iPad number?"
         
 #------- Scans and Predictions ----------------------------------------------------------------------
-        result = self.route_scan_request(user_input)
+        result = self.route_fleet_request(user_input)
+        if result is not None:
+            return result
+
+        result = self.route_scan_request(user_input, chart_mode)
         if result is not None:
             return result
 
+        self.routed("answer")
         return self.answer(user_input)
     
 
+    def routed(self, intent):
+        """Record the intent the current message was routed to, for the response cache and the trace."""
+        _routed_intent.set(intent)
+        set_intent(intent)
+
+    def has_pending_state(self):
+        """True while a multi-turn conversation (confirmation, form, flow, parcel, ...) is in progress."""
+        return any((
+            self.awaiting_info, self.awaiting_shipping, self.pending_retailer, self.pending_column,
+            self.awaiting_multi_info, self.awaiting_confirmation, self.awaiting_retailer,
+            self.awaiting_parcel, self.pending_action, self.awating_equipment_choice,
+            self.awaiting_manual_enter, self.active_troubleshooting, self.awaiting_flow_retailer,
+            self.pending_flow_id, self.active_scan_entry,
+        ))
+
+    def data_changed(self):
+        """Invalidate cached replies after a retailer or troubleshooting write."""
+        self.data_version += 1
+        if self.responses is not None:
+            self.responses.clear()
+
     def answer(self, user_input):
         self.last_user_input = user_input
 
         if is_retailer_info_question(user_input):
+            self.routed("retailer_info")
             return self.get_mutliple_info(user_input)
 
         if not is_retailer_info_question(user_input):
+            self.routed("troubleshooting")
             return self.get_troubleshooting_answer(user_input)
         
 
         ranked = find_best_row(user_input, self.df_customer_info, threshold=40)
         row_index, retailer_name, r_score = ranked
 
-        print("Debug... ", row_index, retailer_name, r_score)
+        logger.debug("answer: row=%s retailer=%r score=%s", row_index, retailer_name, r_score)
         if retailer_name is None:
             if is_retailer_info_question(user_input):
                 return f"Sorry I couldn't find that retailer. Can you double-check the name?"
@@ -281,6 +406,7 @@ class RetailBot:
         return f"{friend_col} for {retailer_name} is: {value}"
 
 
+    @traced("match_troubleshooting")
     def get_troubleshooting_answer(self, user_input):
         """Use TF-IDF to find the closest troubleshooting answer from df_trouble"""
         if is_retailer_info_question(user_input):
@@ -291,13 +417,15 @@ class RetailBot:
             similarities = cosine_similarity(user_vec, self.tfidf_trouble).flatten()
             best_index = similarities.argmax()
             score = similarities[best_index]
+            annotate(score=round(float(score), 3))
+            MATCH_SCORE.observe(float(score), "troubleshooting")
 
             if score < TROUBLE_THREASHOLD:
                 return None
 
             return self.df_trouble['question'].iloc[best_index] + ": " + self.df_trouble['answer'].iloc[best_index]
         except Exception as e:
-            print("Debug...", e)
+            logger.exception("Troubleshooting search failed")
             return "Sorry, something went wrong while searching for a troubleshooting answer."
     
 
@@ -381,7 +509,7 @@ class RetailBot:
             return self.get_mutliple_info(user_input)
         
         if is_retailer_info_question(user_input):
-            print(">>> FULL INFO PATH for retailer:", retailer_name)
+            logger.debug("Full info path for retailer %r", retailer_name)
 
             row = self.df_customer_info.iloc[row_index]
             requested_field = extract_requested_field(user_input)
@@ -413,7 +541,7 @@ class RetailBot:
             return "Ground"
         if shipping in ["2 day", "two day", "2d", "two d"]:
             return "2 Day"
-        if shipping in ["Overnight"]:
+        if shipping in ["overnight"]:
             return "Overnight"
         
         return None
@@ -453,77 +581,72 @@ class RetailBot:
             return result
 
     def handle_parcel_shipper(self, user_input, shipping_method="Ground"):
-        import re
-        from openpyxl.drawing.image import Image
-
-
         ranked = find_best_row(user_input, self.df_customer_info, threshold=60)
         row_index, retailer_name, score = ranked
 
         if retailer_name is None:
             return "I couldn't find that retailer. please try agian"
-        
-        template_path = "/Users/phood/Template/Parcel_Shipper_Template.xlsx"
-        if not os.path.exists(template_path):
-            return "Parcel shipper file not found."
-        
-        wb = load_workbook(template_path)
-        ws = wb.active
-
-        log_path = "/Users/phood/Template/Logo/Picture1.png"
-
-        if os.path.exists(log_path) and not ws._images:
-            img = Image(log_path)
-            img.anchor = "F3"
-            ws.add_image(img)
-
 
         row = self.df_customer_info.iloc[row_index]
 
-        #==== map the cells ===
-        ws["B9"] = datetime.now().strftime("%m/%d/%Y")
-        ws["G9"] = row['retailer']
-        ws["G10"] = ws["G10"].value + f" {row['fitter']}"
-        ws["G11"] = row['street']
-        
-        city = row['city']
-        state = row['state']
-        zip_code = str(int(float(row['zip_code']))) if pd.notna(row['zip_code']) else ""
-
-        ws["G12"] = f"{city}, {state} {zip_code}"
-        ws["G13"] = row['country']
-        ws["B19"] = ws["B19"].value + f" {row['account_number']}"
-
         parcel_state = self.awaiting_parcel or {}
+        contents = shipment_text(row, parcel_state.get("use_equipment_on_file"), parcel_state.get("manual_items"))
 
-        if parcel_state.get("use_equipment_on_file") is False:
-            shipment_text = parcel_state.get("manual_items", "Manual shipment")
-        else:
-            shipment_text = f"Trupad {row['ipad_number']} and {row['sensor_serial']}"
-
-        ws["B23"] = f"{ws['B23'].value} {shipment_text}"
-        ws["C30"] = "X"
-        ws["B32"] = shipping_method
-        ws["B33"] = "NO"
-
-        retailer_safe = re.sub(r'[^a-zA-z0-9_-]', '_', retailer_name)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        output_dir = os.path.join(os.getcwd(), "generated")
-        os.makedirs(output_dir, exist_ok=True)
+        if not os.path.exists(PARCEL_TEMPLATE):
+            return "Parcel shipper file not found."
 
-        output_path = os.path.join(
-            output_dir,
-            f"parcel_{retailer_safe}_{timestamp}.xlsx"
-        )
+        if self.jobs:
+            return self.run_in_background(
+                "parcel", f"the parcel shipper for {retailer_name}",
+                self.parcel_reply, row.to_dict(), shipping_method, contents,
+            )
+        return self.parcel_reply(row, shipping_method, contents)
 
-        wb.save(output_path)
+    def parcel_reply(self, row, shipping_method, contents):
+        try:
+            buf, filename = fill_parcel_shipper(row, shipping_method, contents)
+        except FileNotFoundError:
+            return "Parcel shipper file not found."
 
         return {
-            "file": output_path,
-            "filename": os.path.basename(output_path)
+            "file": buf,
+            "filename": filename
         }
     
+    def parcel_jobs(self, shipments):
+        """
+        Resolve a bulk parcel request into jobs for parcel.stream_parcel_zip. Each shipment is
+        {"retailer", "shipping_method" (default Ground), "use_equipment_on_file" (default true), "manual_items"}.
+        """
+        jobs = []
+        for item in shipments:
+            label = str(item.get("retailer") or "").strip()
+            job = {"label": label, "row": None, "shipping_method": None, "contents": None, "error": None}
+            jobs.append(job)
+
+            row_index, retailer_name, score = find_best_row(label, self.df_customer_info, threshold=60) if label else (None, None, 0)
+            if retailer_name is None:
+                job["error"] = "retailer not found"
+                continue
+
+            method = self.parse_shipping_method(item.get("shipping_method") or "Ground")
+            if not method:
+                job["error"] = f"unknown shipping method '{item.get('shipping_method')}'"
+                continue
+
+            use_on_file = item.get("use_equipment_on_file", True)
+            if use_on_file is False and not item.get("manual_items"):
+                job["error"] = "manual_items required when not using equipment on file"
+                continue
+
+            row = self.df_customer_info.iloc[row_index].to_dict()
+            job.update(
+                row=row,
+                shipping_method=method,
+                contents=shipment_text(row, use_on_file, item.get("manual_items")),
+            )
+        return jobs
+
     def update_customer_info(self, retailer_name, updates: dict):
         retailer_name = str(retailer_name).strip()
 
@@ -541,6 +664,7 @@ class RetailBot:
             if col in self.df_customer_info.columns:
                 cursor.execute(f"UPDATE retailers set {col} = ? WHERE retailer = ?", (val, retailer_name))
         conn.commit()
+        self.data_changed()
 
         return f"Updated {retailer_name} successfully."
     
@@ -595,12 +719,7 @@ class RetailBot:
                 return "Internal error: retailer mismatch. Please ask again"
             
 
-            print("===== DEBUG ROW CHECK =====")
-            print("User input:", user_input)
-            print("Expected retailer:", retailer)
-            print("Row index:", row_index)
-            print("Row retailer:", row.get("retailer"))
-            print("===========================")
+            logger.debug("Row check: input=%r expected=%r row=%s row retailer=%r", user_input, retailer, row_index, row.get("retailer"))
             responses = []
             for col in request_cols:
                 value = row.get(col, "")
@@ -650,6 +769,8 @@ class RetailBot:
                 changed.append(column)
 
         self.conn.commit()
+        if changed:
+            self.data_changed()
 
         if not changed:
             return f"No updates were applied for {retailer}"
@@ -657,7 +778,31 @@ class RetailBot:
         update_fields = ", ".join(col.replace("_", " ") for col in updates)
         return f"Updated {update_fields} for {retailer}."
     
-    def route_scan_request(self, user_input):
+    def route_fleet_request(self, user_input):
+        """Fleet-wide scan questions; single-retailer scan questions fall through to route_scan_request."""
+        if is_scan_alert_request(user_input):
+            self.routed("scan_alerts")
+            self.scan_alerts.tick()
+            return self.scan_alerts.format_alerts(self.scan_alerts.open_alerts())
+
+        n = extract_top_retailers(user_input)
+        if n:
+            self.routed("fleet_top")
+            return self.fleet.format_top_retailers(self.fleet.top_retailers(n), n)
+
+        pct = extract_scan_drop_percent(user_input)
+        if pct:
+            self.routed("fleet_drops")
+            return self.fleet.format_scan_drops(self.fleet.scan_drops(pct), pct)
+
+        months = extract_inactive_months(user_input)
+        if months:
+            self.routed("fleet_inactive")
+            return self.fleet.format_inactive_retailers(self.fleet.inactive_retailers(months), months)
+
+        return None
+
+    def route_scan_request(self, user_input, chart_mode=None):
         text = user_input.lower()
 
         if not any(k in text for k in ["scan", "scans", "history", "how many", "count", "predict", "forecast", "projection"]):
@@ -666,6 +811,7 @@ class RetailBot:
         row_index, retailer, score = find_best_row(text, self.df_customer_info, threshold=60)
 
         if any(k in text for k in ["predict", "forecast", "future", "projection"]):
+            self.routed("scan_forecast")
             months = extract_months(text) or 3
 
             if not retailer:
@@ -674,53 +820,95 @@ class RetailBot:
             if not self.predictor.retailer_exists(retailer):
                 return f"Retailer {retailer} not found"
             
-            result = self.predictor.predict_scans_with_graph(retailer, months)
-            preds = result["predictions"]
-
-            if preds["predicted_scan_count"].sum() == 0:
-                return f"Not enough scan history for {retailer}"
-            
-            text_out = "\n".join(
-                f"{row['ds'].strftime('%b %Y')}: {int(row['predicted_scan_count'])}"
-                for _, row in preds.iterrows()
-            )
-
-            return {
-                "text": f"Predicted scans for {retailer}:\n{text_out}",
-                "image": result["image"]
-            }
+            if self.jobs:
+                return self.run_in_background(
+                    "forecast", f"the scan forecast for {retailer}",
+                    self.forecast_job, retailer, months, chart_mode,
+                )
+            return self.forecast_reply(self.predictor, retailer, months, chart_mode)
         
         if any(k in text for k in ["how many", "count", "total", "number", "past scan", "history"]):
+            self.routed("scan_history")
 
             if not retailer:
                 return "Which retailer?"
             
+            months = None
             if "last" in text or "months" in text:
                 months = extract_months(user_input) or 3
-                df = self.scan_history.scans_last_n_months(retailer, months)
-                
-            else:
-                df = self.scan_history.scans_full_history(retailer)
-            
-            if df.empty:
-                return f"No scan history found for {retailer}"
-            
-            retail_month = self.scan_history.scans_monthly_history(retailer)
-            text_out = self.scan_history.format_monthly_counts(retail_month)
-            graph_img = self.scan_history.plot_scan_history(df, retailer)
-            
-            return {
-                "text": f"Scan history for {retailer}:\n{text_out}",
-                "image": graph_img
-            }
+
+            if self.jobs:
+                return self.run_in_background(
+                    "history", f"the scan history for {retailer}",
+                    self.history_job, retailer, months, chart_mode,
+                )
+            return self.history_reply(self.scan_history, retailer, months, chart_mode)
     
         return None
+
+    def run_in_background(self, kind, description, fn, *args):
+        """Queue fn(*args) on self.jobs; the reply carries the job id for the client to poll."""
+        job_id = self.jobs.submit(kind, fn, *args, description=description)
+        return {
+            "text": f"Working on {description}…",
+            "job": job_id
+        }
+
+    @traced("forecast")
+    def forecast_reply(self, predictor, retailer, months, chart_mode=None):
+        result = predictor.predict_scans_with_graph(retailer, months, chart_mode=chart_mode)
+        preds = result.pop("predictions")
+
+        if preds["predicted_scan_count"].sum() == 0:
+            return f"Not enough scan history for {retailer}"
+        
+        text_out = "\n".join(
+            f"{row['ds'].strftime('%b %Y')}: {int(row['predicted_scan_count'])}"
+            for _, row in preds.iterrows()
+        )
+
+        return with_chart({"text": f"Predicted scans for {retailer}:\n{text_out}"}, result)
+
+    @traced("scan_history")
+    def history_reply(self, scan_history, retailer, months=None, chart_mode=None):
+        if months:
+            monthly = scan_history.scans_last_n_months(retailer, months)
+        else:
+            monthly = scan_history.scans_full_history(retailer)
+        
+        if monthly.empty or monthly["count"].sum() == 0:
+            return f"No scan history found for {retailer}"
+        
+        # One monthly series feeds both the text and the chart
+        text_out = scan_history.format_monthly_counts(monthly)
+        chart = chart_response(scan_history.chart_spec(monthly, retailer), chart_mode)
+        
+        return with_chart({"text": f"Scan history for {retailer}:\n{text_out}"}, chart)
+
+    # Jobs run on worker threads, so they use their own connection rather than self.conn.
+    # The chart is rendered inside the job, in the mode the client asked for, so fetching
+    # the result only hands back the cached chart's URL.
+
+    def forecast_job(self, retailer, months, chart_mode=None):
+        conn = sqlite3.connect(self.db_path, timeout=10, factory=TimedConnection)
+        try:
+            return self.forecast_reply(ScanPredictor(conn), retailer, months, chart_mode)
+        finally:
+            conn.close()
+
+    def history_job(self, retailer, months, chart_mode=None):
+        conn = sqlite3.connect(self.db_path, timeout=10, factory=TimedConnection)
+        try:
+            return self.history_reply(ScanHistory(conn), retailer, months, chart_mode)
+        finally:
+            conn.close()
     
     def handel_help(self):
         help_commands = [
             "Customer Info lookup: 'What is the useranme and password for forever me? (Try all info)\n",
             "Check scan history: Scan history for 3 months for images boutique (or just scan history for)\n",
-            "Predict future scans: Predict scans for 4 months for images boutique (up to 12 months)\n"
+            "Predict future scans: Predict scans for 4 months for images boutique (up to 12 months)\n",
+            "Fleet scans: Top 5 retailers this month / Retailers whose scans dropped more than 40% / Retailers with no scans in 3 months\n"
         ]
 
         help_text = "Here are some examples of how you can interact with me! I recommend copy and pasting:\n\n"
@@ -730,10 +918,23 @@ class RetailBot:
     def refresh_customer_db(self):
         self.df_customer_info = pd.read_sql_query("SELECT * FROM retailers", self.conn)
 
+    def index_troubleshooting(self):
+        self.df_trouble['clean_question'] = self.df_trouble['question'].astype(str).apply(clean_text_tfidf)
+        self.vectorizer_trouble = TfidfVectorizer(ngram_range=(1, 2))
+        self.tfidf_trouble = self.vectorizer_trouble.fit_transform(self.df_trouble['clean_question'])
+
+    def reload_troubleshooting(self):
+        """Pick up new troubleshooting answers and flows without a restart."""
+        self.df_trouble = pd.read_sql_query("SELECT * FROM troubleshooting", self.conn)
+        self.index_troubleshooting()
+        self.troubleshooting_flows = self.load_flows()
+        self.data_changed()
+        return len(self.df_trouble), len(self.troubleshooting_flows)
+
 
     def load_flows(self, path="Troubleshooting_flows/Troubleshooting.json"):
         if not os.path.exists(path):
-            print(f"Flow file not found: {path}")
+            logger.warning("Flow file not found: %s", path)
             return {}
         
         with open(path, "r") as f:
@@ -970,7 +1171,7 @@ class RetailBot:
         except ValueError as e:
             return {"text": f"⚠ Invalid date format. Please use MM/DD/YYYY"}
         except Exception as e:
-            print(f"Error adding scan: {e}")
+            logger.exception("Error adding scan")
             return {"text": "⚠ Failed to add scan"}
     
     def update_retailer_form(self):
@@ -1021,8 +1222,7 @@ class RetailBot:
                     if k:
                         updates[k] = item.get("value")
 
-        print("ALLOWED:", allowed_update_columns)
-        print("UPDATES:", updates)
+        logger.debug("Retailer updates %s (allowed: %s)", updates, allowed_update_columns)
 
         # Allow-list filter
         safe_updates = {k: v for k, v in updates.items() if k in allowed_update_columns}
@@ -1043,6 +1243,8 @@ class RetailBot:
 
         self.conn.commit()
         self.refresh_customer_db()
+        if rows_changed:
+            self.data_changed()
 
         if rows_changed == 0:
             return {"text": f"⚠ No rows updated for {retailer} (value may be unchanged)."}
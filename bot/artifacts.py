@@ -0,0 +1,211 @@
+"""
+Store for files the bot generates (parcel shippers and the like).
+
+Artifacts are named by a hash of their content, so the same output is stored once
+however many times it is requested. The artifacts table indexes the files;
+artifact_requests records who asked for what. A background sweeper evicts files
+unused for longer than the retention period, then the least recently used ones
+until the store fits its size cap.
+
+    RI_ARTIFACT_DIR            store folder (default generated/artifacts)
+    RI_ARTIFACT_MAX_MB         size cap (default 500)
+    RI_ARTIFACT_MAX_AGE_DAYS   evict files not downloaded for this long (default 30)
+    RI_ARTIFACT_SWEEP_SECONDS  sweeper interval (default 600)
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = os.environ.get(
+    "RI_ARTIFACT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "generated", "artifacts"),
+)
+ARTIFACT_MAX_BYTES = int(float(os.environ.get("RI_ARTIFACT_MAX_MB", "500")) * 1024 * 1024)
+ARTIFACT_MAX_AGE_DAYS = float(os.environ.get("RI_ARTIFACT_MAX_AGE_DAYS", "30"))
+ARTIFACT_SWEEP_SECONDS = float(os.environ.get("RI_ARTIFACT_SWEEP_SECONDS", "600"))
+
+ARTIFACT_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Parts of an Office file that change on every save without changing the document
+_VOLATILE_MEMBERS = {"docProps/core.xml"}
+
+
+def content_hash(data, filename=""):
+    """
+    sha256 of a file's content. Office files are zip archives whose metadata holds
+    the save time, so for those the hash covers every member except that metadata:
+    two shippers with the same cells hash the same.
+    """
+    if filename.lower().endswith((".xlsx", ".docx", ".pptx")):
+        try:
+            h = hashlib.sha256()
+            with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                for name in sorted(zf.namelist()):
+                    if name in _VOLATILE_MEMBERS:
+                        continue
+                    h.update(name.encode("utf-8") + b"\0")
+                    h.update(zf.read(name))
+            return h.hexdigest()
+        except zipfile.BadZipFile:
+            pass
+    return hashlib.sha256(data).hexdigest()
+
+
+class ArtifactStore:
+    def __init__(self, db_path, directory=ARTIFACT_DIR, max_bytes=ARTIFACT_MAX_BYTES, max_age_days=ARTIFACT_MAX_AGE_DAYS):
+        self.db_path = db_path
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._sweeper = None
+        # put's exists-check, write and index row vs sweep's delete and unlink: without it a
+        # sweep could remove a file put had just found present and is about to link to
+        self._lock = threading.Lock()
+        self._ensure_tables()
+
+    def _connect(self):
+        # Called from request threads and the sweeper, so every call gets its own connection
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA busy_timeout=5000;")
+        return conn
+
+    def _ensure_tables(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS artifacts (
+                        hash TEXT PRIMARY KEY,
+                        download_name TEXT NOT NULL,
+                        mimetype TEXT,
+                        size INTEGER NOT NULL,
+                        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        last_access TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_last_access ON artifacts(last_access)")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS artifact_requests (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        hash TEXT NOT NULL,
+                        username TEXT,
+                        request TEXT,
+                        download_name TEXT,
+                        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_artifact_requests_hash ON artifact_requests(hash)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_artifact_requests_user ON artifact_requests(username, created_at)")
+        finally:
+            conn.close()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def put(self, data, download_name, mimetype=None, username=None, request=None):
+        """Store bytes (or a file object) and record the request. Returns the artifact key."""
+        if hasattr(data, "read"):
+            data = data.read()
+        key = content_hash(data, download_name)
+
+        with self._lock:
+            if not os.path.exists(self.path(key)):
+                os.makedirs(self.directory, exist_ok=True)
+                tmp = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self.path(key))
+
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        """
+                        INSERT INTO artifacts (hash, download_name, mimetype, size) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(hash) DO UPDATE SET last_access = CURRENT_TIMESTAMP, download_name = excluded.download_name
+                        """,
+                        (key, download_name, mimetype, len(data)),
+                    )
+                    conn.execute(
+                        "INSERT INTO artifact_requests (hash, username, request, download_name) VALUES (?, ?, ?, ?)",
+                        (key, username, request, download_name),
+                    )
+            finally:
+                conn.close()
+        return key
+
+    def get(self, key):
+        """(path, download_name, mimetype) for a stored artifact, or None. Marks it as used."""
+        if not ARTIFACT_KEY_RE.match(key) or not os.path.exists(self.path(key)):
+            return None
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute(
+                    "UPDATE artifacts SET last_access = CURRENT_TIMESTAMP WHERE hash = ? RETURNING download_name, mimetype",
+                    (key,),
+                ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return self.path(key), row[0], row[1]
+
+    def sweep(self):
+        """Evict expired artifacts, then least recently used ones until under max_bytes. Returns files removed."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    expired = conn.execute(
+                        "DELETE FROM artifacts WHERE last_access < datetime('now', ?) RETURNING hash",
+                        (f"-{self.max_age_days} days",),
+                    ).fetchall()
+
+                    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+                    evicted = []
+                    if total > self.max_bytes:
+                        for key, size in conn.execute("SELECT hash, size FROM artifacts ORDER BY last_access").fetchall():
+                            if total <= self.max_bytes:
+                                break
+                            evicted.append((key,))
+                            total -= size
+                        conn.executemany("DELETE FROM artifacts WHERE hash = ?", evicted)
+            finally:
+                conn.close()
+
+            removed = 0
+            for (key,) in expired + evicted:
+                try:
+                    os.remove(self.path(key))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def start_sweeper(self, interval=ARTIFACT_SWEEP_SECONDS):
+        """Run sweep() every `interval` seconds on a daemon thread (once per store)."""
+        if self._sweeper is not None:
+            return
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.warning("Artifact sweep failed: %s", e)
+
+        self._sweeper = threading.Thread(target=loop, name="artifact-sweeper", daemon=True)
+        self._sweeper.start()
@@ -1,3 +1,4 @@
+import logging
 import numpy as np
 import re
 from sklearn.feature_extraction.text import TfidfVectorizer
@@ -5,16 +6,15 @@ from sklearn.metrics.pairwise import cosine_similarity
 from rapidfuzz import fuzz, process
 from bot.bot_utils import clean_text, safe_print
 from bot.Keywords import exit_commands, column_aliases
+from bot.masking import mask_value_for_debug
+from bot.metrics import MATCH_SCORE
+from bot.tracing import annotate, traced
 
-
-# Creating helper functions
-def mask_value_for_debug(user_input):
-    s = str(user_input)
-    if len(s) <= 4:
-        return "*" * len(s)
-    return s[:2] + "*" * (len(s) - 4) + s[-2:]
+logger = logging.getLogger(__name__)
 
 
+# Creating helper functions
+@traced("match_troubleshooting")
 def find_best_troubleshooting_answer(user_input, df_trouble, tfidf_trouble, vectorizer_trouble):
     # match user input to closest troubleshooting question in sheet
     try:
@@ -23,7 +23,9 @@ def find_best_troubleshooting_answer(user_input, df_trouble, tfidf_trouble, vect
         similarities = cosine_similarity(user_vec, tfidf_trouble).flatten()
         best_index = similarities.argmax()
         score = similarities[best_index]
-        print(f"Debug.. Troubleshooting best match score: {score:.3f}")
+        annotate(score=round(float(score), 3))
+        MATCH_SCORE.observe(float(score), "troubleshooting")
+        logger.debug("Troubleshooting best match score: %.3f", score)
         if score < 0.1:
             return None
         return df_trouble['Answer'].iloc[best_index]
@@ -31,13 +33,13 @@ def find_best_troubleshooting_answer(user_input, df_trouble, tfidf_trouble, vect
         # safe_print("Error in troubleshooting match", e)
         return None
 
+@traced("resolve_column")
 def find_best_column(user_input, column_aliases, threshold=0.60, ):
     # Find which column best fits for user question
     try:
         # clean user input 
         clean_input = user_input.lower().strip()
-        print(f"Debug.. find_best_column input; '{user_input}' - '{clean_input}'")
-        print(f"Debug.. find_best_column: '{user_input}, cleaned: '{clean_input}")
+        logger.debug("find_best_column input %r, cleaned %r", user_input, clean_input)
         all_aliases = []
         alias_to_col = {}
         for real_col, alias_list in column_aliases.items():
@@ -63,7 +65,9 @@ def find_best_column(user_input, column_aliases, threshold=0.60, ):
         best_score = float(combined_scores[best_index])
         best_col = alias_to_col[best_alias]
 
-        print(f"Debug.. Best column alias: '{best_alias}' - '{best_col}' (score={best_score:.2f})")
+        annotate(column=best_col, score=round(best_score, 3))
+        MATCH_SCORE.observe(best_score, "column")
+        logger.debug("Best column alias %r -> %r (score=%.2f)", best_alias, best_col, best_score)
 
         if best_score < threshold:
             return None
@@ -71,8 +75,8 @@ def find_best_column(user_input, column_aliases, threshold=0.60, ):
     except Exception as e:
         return None
 
+@traced("resolve_retailer")
 def find_best_row(user_input, df_customer_info, threshold=60):
-    print("USING NEW FIND BEST ROW")
     # indentify the customer mentioned in user input
     try:
         #clean input and remove white space
@@ -90,23 +94,27 @@ def find_best_row(user_input, df_customer_info, threshold=60):
 
         best_score = 0
         best_retailer = None
+        debug = logger.isEnabledFor(logging.DEBUG)
 
         for retailer in retailers:
                 score = fuzz.partial_ratio(
                     retailer.lower(),
                     cleaned_input
                 )
-                print(f"Debug... retailer '{retailer}' score: {score}")
+                if debug:
+                    logger.debug("retailer %r score: %s", retailer, score)
                 if score > best_score:
                     best_score = score
                     best_retailer = retailer
 
+        annotate(retailer=best_retailer, score=float(best_score), candidates=len(retailers))
+        MATCH_SCORE.observe(best_score / 100, "retailer")
         if best_score < threshold:
             return None, None, best_score
 
         row_index = df_customer_info.index[df_customer_info["retailer"].str.strip() == best_retailer][0]
         row_id = int(df_customer_info.loc[row_index, "id"])
-        print("Debug.. ", best_retailer, best_score)
+        logger.debug("Best retailer %r (score=%s)", best_retailer, best_score)
         return row_index, best_retailer, best_score
 
     except Exception as e:
@@ -170,6 +170,57 @@ def extract_requested_field(user_input):
             return col
     return None
 
+def extract_device_history_code(text):
+    """'history of device ABC123' / 'device history for ABC123' / 'device log A0042' -> the code"""
+    match = re.search(r"\b(?:history|log)\s+(?:of|for)\s+device\s+([\w\-\.]+)", text, re.IGNORECASE)
+    if not match:
+        match = re.search(r"\bdevice\s+(?:history|log)\s+(?:of|for)\s+([\w\-\.]+)", text, re.IGNORECASE)
+    if not match:
+        # Without "of/for" only a code-like token (has a digit) counts: not "device log in screen"
+        match = re.search(r"\bdevice\s+(?:history|log)\s+([\w\-\.]*\d[\w\-\.]*)", text, re.IGNORECASE)
+    return match.group(1).rstrip(".") if match else None
+
+def extract_device_receiver(text):
+    """'what did Images Boutique receive' / 'devices received by Images Boutique' -> 'Images Boutique'"""
+    # "get"/"got" only count next to a device word: "what did walmart get for their password" is a retailer question
+    match = re.search(r"\bwhat\s+(?:(?:devices?|equipment|ipads?|sensors?)\s+)?(?:did|has)\s+(.+?)\s+(?:receive|received)\b", text, re.IGNORECASE)
+    if not match:
+        match = re.search(r"\bwhat\s+(?:devices?|equipment|ipads?|sensors?)\s+(?:did|has)\s+(.+?)\s+(?:get|got)\b", text, re.IGNORECASE)
+    if not match:
+        match = re.search(r"\bdevices\s+(?:received\s+by|sent\s+to|checked\s+out\s+to)\s+(.+?)[\?\.]*$", text, re.IGNORECASE)
+    return match.group(1).strip() if match else None
+
+def extract_top_retailers(text):
+    """'top 5 retailers this month' / 'which retailers scanned the most' -> 5 (default 10)"""
+    match = re.search(r"\btop\s+(\d+)?\s*retailers?\b", text, re.IGNORECASE)
+    if match:
+        return int(match.group(1) or 10)
+    if re.search(r"\bretailers?\b.*\b(?:most|highest)\s+scans?\b|\bscanned\s+the\s+most\b", text, re.IGNORECASE):
+        return 10
+    return None
+
+def extract_scan_drop_percent(text):
+    """'retailers whose scans dropped more than 40%' -> 40, 'scan drops' -> 50"""
+    match = re.search(r"\b(?:drop(?:ped)?|fell|fallen|declined?)\s+(?:by\s+)?(?:more\s+than\s+|over\s+)?(\d+)\s*(?:%|percent)", text, re.IGNORECASE)
+    if match:
+        return int(match.group(1))
+    if re.search(r"\bscans?\s+drops?\b|\bretailers?\b.*\bscans?\s+(?:dropped|declined|fell)\b", text, re.IGNORECASE):
+        return 50
+    return None
+
+def extract_inactive_months(text):
+    """'retailers with no scans in 6 months' -> 6, 'inactive retailers' -> 3"""
+    match = re.search(r"\bno\s+scans?\s+(?:in|for)\s+(?:the\s+last\s+|over\s+)?(\d+)\s*(?:months?|mo)\b", text, re.IGNORECASE)
+    if match:
+        return int(match.group(1))
+    if re.search(r"\b(?:inactive|quiet|dormant)\s+retailers?\b|\bretailers?\s+(?:with|that\s+have)\s+no\s+scans?\b", text, re.IGNORECASE):
+        return 3
+    return None
+
+def is_scan_alert_request(text):
+    """'show scan alerts' / 'any scan anomalies?'"""
+    return re.search(r"\b(?:scan\s+)?(?:alerts?|anomal(?:y|ies))\b", text, re.IGNORECASE) is not None and "scan" in text.lower()
+
 def is_troubleshooting_list_request(text):
     text = text.lower()
     return any(t in text for t in trouble_shooting_triggers)
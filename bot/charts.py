@@ -0,0 +1,374 @@
+"""
+Chart rendering for chat responses.
+
+Charts are described by a plain dict (a "spec") and rendered with Matplotlib's
+object-oriented API: every render builds its own Figure on an Agg canvas, so
+nothing touches pyplot's global state. Rendering runs in a small process pool,
+which keeps PNG encoding off the request threads and lets concurrent chart
+requests render in parallel.
+
+    RI_CHART_DPI       output resolution (default 100)
+    RI_CHART_WORKERS   renderer processes (default 2)
+    RI_CHART_TIMEOUT   seconds a render may run once a worker has picked it up (default 10)
+    RI_CHART_WAIT      seconds a request waits for its chart, queueing included (default 30)
+
+The render timeout is enforced inside the worker, so time spent queued behind
+other charts doesn't count against it. A render that overruns is interrupted
+and its worker carries on with the next chart; one stuck in C code, where the
+interrupt can't land, makes its worker exit, and the pool is replaced. A request
+that stops waiting only drops its own chart and leaves the pool alone.
+
+Rendered PNGs are content-addressed: the sha256 of the spec names the image,
+so identical data and style render once. They live in a small in-memory LRU
+backed by a size-capped folder and are served from /charts/<key>.png.
+
+    RI_CHART_CACHE_DIR    on-disk cache folder (default generated/charts)
+    RI_CHART_CACHE_ITEMS  PNGs kept in memory (default 128)
+    RI_CHART_CACHE_MB     on-disk cap; oldest files are evicted first (default 64)
+
+In "data" chart mode no image is rendered at all: the reply carries the chart's
+points as JSON and the browser draws it. RI_CHART_MODE sets the default ("png"
+or "data"); /chat requests can override it with a chart_mode field.
+
+Inside a deferred_charts() block (/chat/stream) PNG charts aren't rendered: the
+reply carries the bare spec so the text can be sent first and the chart resolved
+afterwards in the client's mode (resolve_chart). Data-mode charts cost nothing
+to build and are returned as usual. "deferred" as a chart_mode does the same for
+callers that can't wrap the call in the block.
+"""
+import contextvars
+import faulthandler
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import pandas as pd
+
+from bot.metrics import record_cache
+from bot.tracing import annotate, span
+
+logger = logging.getLogger(__name__)
+
+CHART_DPI = int(os.environ.get("RI_CHART_DPI", "100"))
+RENDER_WORKERS = int(os.environ.get("RI_CHART_WORKERS", "2"))
+RENDER_TIMEOUT = float(os.environ.get("RI_CHART_TIMEOUT", "10"))
+RENDER_WAIT = float(os.environ.get("RI_CHART_WAIT", "30"))
+
+CHART_CACHE_DIR = os.environ.get(
+    "RI_CHART_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "generated", "charts"),
+)
+CHART_CACHE_ITEMS = int(os.environ.get("RI_CHART_CACHE_ITEMS", "128"))
+CHART_CACHE_BYTES = int(float(os.environ.get("RI_CHART_CACHE_MB", "64")) * 1024 * 1024)
+CHART_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+CHART_UNAVAILABLE = "(Chart unavailable right now.)"
+
+CHART_MODES = ("png", "data", "deferred")
+CHART_MODE = os.environ.get("RI_CHART_MODE", "png").strip().lower()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_defer = contextvars.ContextVar("ri_defer_charts", default=False)
+
+
+def line_chart_spec(months, values, title, ylabel, dpi=None):
+    """Spec for the monthly line chart used by scan history and predictions."""
+    months = pd.to_datetime(pd.Series(months))
+    return {
+        "kind": "line",
+        "title": title,
+        "xlabel": "Month",
+        "ylabel": ylabel,
+        "x": [m.strftime("%Y-%m-%d") for m in months],
+        "y": [float(v) for v in values],
+        "dpi": int(dpi or CHART_DPI),
+    }
+
+
+def render_png(spec):
+    """Render a spec to PNG bytes. Pure function of the spec; safe to call from any thread or process."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    x = pd.to_datetime(spec["x"])
+
+    fig = Figure(figsize=(8, 4.5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(x, spec["y"], linewidth=2.5, marker="o", markersize=6, linestyle="-", color="green")
+    ax.set_title(spec["title"], fontsize=14, fontweight="bold", pad=12)
+    ax.set_xlabel(spec["xlabel"], fontsize=11, labelpad=8)
+    ax.set_ylabel(spec["ylabel"], fontsize=11, labelpad=8)
+    ax.grid(axis="y", linestyle="--", linewidth=0.6, alpha=0.5)
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    ax.set_xticks(x)
+    ax.set_xticklabels(x.strftime("%b"), rotation=45, ha="right")
+    fig.tight_layout()
+
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=spec.get("dpi", CHART_DPI))
+    return buf.getvalue()
+
+
+class RenderTimeout(Exception):
+    """Raised inside a worker when a render runs past its timeout."""
+
+
+def _on_render_alarm(signum, frame):
+    raise RenderTimeout()
+
+
+def _warm_worker():
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _on_render_alarm)
+    # Pay for the Matplotlib import and font cache once per worker, not on the first chart
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+def _render_in_worker(spec, timeout):
+    """render_png with a timeout that starts when the worker picks the task up, not when it was queued."""
+    if not hasattr(signal, "setitimer"):
+        return render_png(spec)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    # Backstop for a render stuck in C code, where the alarm's exception is never raised:
+    # the worker exits and the parent sees BrokenProcessPool
+    faulthandler.dump_traceback_later(timeout * 2, exit=True)
+    try:
+        return render_png(spec)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        faulthandler.cancel_dump_traceback_later()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, initializer=_warm_worker)
+        return _pool
+
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def start_renderer():
+    """
+    Start the renderer processes now rather than on the first chart. Called at app
+    startup so the workers are created before the server starts its request threads.
+    """
+    if multiprocessing.parent_process() is not None:
+        return  # imported inside a worker; workers don't get pools of their own
+    _get_pool().submit(int).result()
+
+
+def render_chart(spec, timeout=None):
+    """PNG bytes for a spec, rendered in the pool. Returns None if rendering fails or times out."""
+    pool = _get_pool()
+    timeout = timeout or RENDER_TIMEOUT
+    with span("render_chart"):
+        fut = None
+        try:
+            fut = pool.submit(_render_in_worker, spec, timeout)
+            return fut.result(timeout=max(RENDER_WAIT, timeout))
+        except RenderTimeout:
+            logger.warning("Chart render timed out after %ss: %s", timeout, spec.get("title"))
+        except TimeoutError:
+            # Still queued (or running) when this request stopped waiting; the pool is fine
+            fut.cancel()
+            logger.warning("Gave up waiting %ss for chart: %s", max(RENDER_WAIT, timeout), spec.get("title"))
+        except BrokenProcessPool:
+            logger.warning("Chart renderer crashed; restarting the pool")
+            _reset_pool(pool)
+        except Exception as e:
+            logger.warning("Chart render failed: %s", e)
+    return None
+
+
+def chart_key(spec):
+    """Content address of a chart: sha256 of its canonical JSON spec."""
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class ChartCache:
+    """
+    Rendered PNGs by chart_key. Hot entries stay in an in-memory LRU; every entry is
+    also written to disk so it survives eviction and restarts, and the folder is
+    trimmed (oldest first) once it grows past max_bytes.
+    """
+
+    def __init__(self, directory=CHART_CACHE_DIR, max_items=CHART_CACHE_ITEMS, max_bytes=CHART_CACHE_BYTES):
+        self.directory = directory
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _remember(self, key, png):
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def contains(self, key):
+        """Whether a PNG is cached for key, without reading it."""
+        if not CHART_KEY_RE.match(key):
+            return False
+        with self._lock:
+            if key in self._memory:
+                return True
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """PNG bytes for key, or None. Keys must look like chart_key() output."""
+        if not CHART_KEY_RE.match(key):
+            return None
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+                return png
+        try:
+            with open(self._path(key), "rb") as f:
+                png = f.read()
+        except FileNotFoundError:
+            return None
+        self._remember(key, png)
+        return png
+
+    def put(self, key, png):
+        self._remember(key, png)
+        os.makedirs(self.directory, exist_ok=True)
+        # Write then rename so readers never see a partial file
+        tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(png)
+        os.replace(tmp, self._path(key))
+        self._trim(len(png))
+
+    def _trim(self, added):
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += added
+                if self._disk_bytes <= self.max_bytes:
+                    return
+
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".png"):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+            self._disk_bytes = total
+
+
+chart_cache = ChartCache()
+
+
+def chart_url(spec):
+    """
+    URL of the rendered chart for a spec, rendering it only on a cache miss.
+    Returns None if the chart could not be rendered.
+    """
+    key = chart_key(spec)
+    cached = chart_cache.contains(key)
+    annotate(chart_cache="hit" if cached else "miss")
+    record_cache("chart", cached)
+    if not cached:
+        png = render_chart(spec)
+        if png is None:
+            return None
+        chart_cache.put(key, png)
+    return f"/charts/{key}.png"
+
+
+def chart_data(spec):
+    """Compact JSON form of a spec for client-side drawing: ISO months and values."""
+    return {
+        "kind": spec["kind"],
+        "title": spec["title"],
+        "xlabel": spec["xlabel"],
+        "ylabel": spec["ylabel"],
+        "points": [[x[:7], y] for x, y in zip(spec["x"], spec["y"])],
+    }
+
+
+def chart_response(spec, mode=None):
+    """
+    Reply fields for a chart: {"chart": points} in data mode, otherwise
+    {"image": url} of the rendered PNG. Unknown modes fall back to PNG. If the
+    PNG can't be rendered there is no image, only a chart_note for the text.
+    """
+    mode = (mode or CHART_MODE).strip().lower()
+    if mode == "data":
+        return {"chart": chart_data(spec)}
+    if mode == "deferred" or _defer.get():
+        return {"chart_spec": spec}
+    url = chart_url(spec)
+    return {"image": url} if url else {"chart_note": CHART_UNAVAILABLE}
+
+
+@contextmanager
+def deferred_charts():
+    """Leave PNG charts built in this block as a chart_spec for resolve_chart."""
+    token = _defer.set(True)
+    try:
+        yield
+    finally:
+        _defer.reset(token)
+
+
+def with_chart(reply, fields):
+    """Merge chart fields into a reply dict in place; a chart_note is appended to its text."""
+    fields = dict(fields)
+    note = fields.pop("chart_note", None)
+    reply.update(fields)
+    if note:
+        reply["text"] = f"{reply['text']}\n{note}" if reply.get("text") else note
+    return reply
+
+
+def resolve_chart(reply, mode=None):
+    """
+    Replace a deferred chart_spec in a reply with its final chart fields, in place.
+    Returns just those fields ({} if the reply had no deferred chart).
+    """
+    if not isinstance(reply, dict) or "chart_spec" not in reply:
+        return {}
+    if (mode or "").strip().lower() == "deferred":
+        mode = None
+    fields = chart_response(reply.pop("chart_spec"), mode)
+    with_chart(reply, fields)
+    return fields
@@ -0,0 +1,243 @@
+"""
+Timed SQLite connections and the slow-query log.
+
+    conn = sqlite3.connect(path, factory=TimedConnection)
+
+Every statement run through the connection or its cursors (including
+pd.read_sql_query, which uses cursor()) is timed, execute plus fetches, and
+aggregated per statement shape: whitespace collapsed, literals and IN lists
+folded to ?. Statements slower than the threshold are logged with their
+parameters masked, since the tables hold credentials. The first time a shape is
+slow its EXPLAIN QUERY PLAN is captured, so a full-table scan such as
+LOWER(retailer) = ? without a matching index shows up on /admin/queries. Plans
+are captured on a separate read-only connection so the caller's transaction is
+never touched; for an in-memory database the plan waits for a slow run outside
+a transaction.
+
+    RI_SLOW_QUERY_MS     threshold in milliseconds (default 50)
+    RI_SLOW_QUERY_LOG    slow statements kept in memory (default 200)
+
+Rows read by iterating a cursor directly (`for row in cur`) aren't timed; the
+execute and fetch*() calls are.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from urllib.parse import quote
+
+from bot.masking import mask_value_for_debug
+from bot.metrics import SLOW_QUERIES
+
+SLOW_QUERY_MS = float(os.environ.get("RI_SLOW_QUERY_MS", "50"))
+SLOW_QUERY_LOG = int(os.environ.get("RI_SLOW_QUERY_LOG", "200"))
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def mask_params(params):
+    """Parameters safe to log: strings and bytes masked, numbers and NULLs kept."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: mask_params([v])[0] for k, v in params.items()}
+    return [
+        v if v is None or isinstance(v, (int, float)) else mask_value_for_debug(v)
+        for v in params
+    ]
+
+
+def statement_shape(sql):
+    shape = _STRING_RE.sub("?", sql)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _SPACE_RE.sub(" ", shape).strip()
+    return _IN_LIST_RE.sub("IN (?...)", shape)
+
+
+class QueryLog:
+    """Per-shape statement stats and a bounded list of recent slow statements."""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, maxlen=SLOW_QUERY_LOG):
+        self.threshold = threshold_ms / 1000
+        self._shapes = {}
+        self._slow = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, sql, elapsed, statement_elapsed, stats=None):
+        """
+        Add time to a statement's shape: elapsed is this call (execute or fetch),
+        statement_elapsed the statement's total so far. stats is the shape entry
+        returned by the statement's first call (None on the first call, which counts it).
+        """
+        with self._lock:
+            if stats is None:
+                shape = statement_shape(sql)
+                stats = self._shapes.get(shape)
+                if stats is None:
+                    stats = self._shapes[shape] = {
+                        "shape": shape, "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                        "slow": 0, "plan": None, "full_scan": False, "explained": False,
+                    }
+                stats["count"] += 1
+            stats["total_ms"] += elapsed * 1000
+            stats["max_ms"] = max(stats["max_ms"], statement_elapsed * 1000)
+        return stats
+
+    def record_slow(self, conn, stats, sql, params, elapsed):
+        with self._lock:
+            stats["slow"] += 1
+            want_plan = not stats["explained"]
+        if want_plan and sql.lstrip().upper().startswith(_EXPLAINABLE):
+            plan_conn, owned = _plan_connection(conn)
+            if plan_conn is not None:
+                try:
+                    plan = explain(plan_conn, sql, params)
+                finally:
+                    if owned:
+                        plan_conn.close()
+                with self._lock:
+                    stats["explained"] = True
+                    stats["plan"] = plan
+                    stats["full_scan"] = any(_is_full_scan(detail) for detail in plan or [])
+
+        masked = mask_params(params)
+        SLOW_QUERIES.inc("full_scan" if stats["full_scan"] else "indexed")
+        logger.warning("Slow query (%.1f ms): %s params=%s", elapsed * 1000, stats["shape"], masked)
+        with self._lock:
+            self._slow.append({
+                "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "ms": round(elapsed * 1000, 2),
+                "shape": stats["shape"],
+                "params": masked,
+            })
+
+    def slow_statements(self):
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def shapes(self, order="total_ms"):
+        with self._lock:
+            rows = [dict(s) for s in self._shapes.values()]
+        for row in rows:
+            row["avg_ms"] = row["total_ms"] / row["count"] if row["count"] else 0.0
+        return sorted(rows, key=lambda r: r[order], reverse=True)
+
+
+query_log = QueryLog()
+
+
+def _is_full_scan(detail):
+    # "SCAN scan_events" is a table scan; "SCAN t USING [COVERING] INDEX ..." walks an index
+    return detail.startswith("SCAN ") and " USING " not in detail
+
+
+def _plan_connection(conn):
+    """
+    (connection, owned) to run EXPLAIN on without touching conn's transaction: a
+    read-only connection to the same file, or conn itself when no transaction is
+    open. (None, False) if neither is possible right now.
+    """
+    path = ""
+    try:
+        for _, name, file in sqlite3.Cursor(conn).execute("PRAGMA database_list").fetchall():
+            if name == "main":
+                path = file
+    except sqlite3.Error:
+        pass
+    if path:
+        try:
+            return sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True, timeout=1), True
+        except sqlite3.Error as e:
+            logger.debug("Could not open %s for query plans: %s", path, e)
+    if not conn.in_transaction:
+        return conn, False
+    return None, False
+
+
+def explain(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN detail lines, or None if the statement can't be explained."""
+    try:
+        cur = sqlite3.Cursor(conn)
+        cur.execute(f"EXPLAIN QUERY PLAN {sql}", params or ())
+        return [row[3] for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        logger.debug("Could not explain %s: %s", sql, e)
+        return None
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that times execute() and fetch*() calls as one statement."""
+
+    _sql = None
+    _params = None
+    _elapsed = 0.0
+    _stats = None
+    _logged = False
+
+    def _finish(self, elapsed):
+        self._elapsed += elapsed
+        self._stats = query_log.record(self._sql, elapsed, self._elapsed, self._stats)
+        if not self._logged and self._elapsed >= query_log.threshold:
+            self._logged = True
+            query_log.record_slow(self.connection, self._stats, self._sql, self._params, self._elapsed)
+
+    def _start(self, sql, params):
+        self._sql, self._params = sql, params
+        self._elapsed, self._stats, self._logged = 0.0, None, False
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._finish(time.perf_counter() - t0)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql, None)
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._finish(time.perf_counter() - t0)
+
+    def _timed_fetch(self, fetch, *args):
+        if self._sql is None:
+            return fetch(*args)
+        t0 = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._finish(time.perf_counter() - t0)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, *(() if size is None else (size,)))
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3.connect(..., factory=TimedConnection): every cursor is a TimedCursor."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts below don't go through cursor().execute(), so route them explicitly
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,64 @@
+import csv
+import io
+import tempfile
+from typing import Iterator, List, Sequence
+
+from openpyxl import Workbook
+
+from bot.inventory import DEVICE_COLUMNS
+
+EXPORT_CHUNK_SIZE = 1000
+FILE_CHUNK_SIZE = 64 * 1024
+
+EXPORT_QUERIES = {
+    "inventory": f"SELECT {DEVICE_COLUMNS} FROM inventory ORDER BY id",
+    "retailers": "SELECT * FROM retailers ORDER BY retailer",
+}
+
+
+def iter_row_chunks(conn, sql: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List[Sequence]]:
+    """
+    Step a cursor through the result set chunk_size rows at a time.
+    First yield is the header; nothing beyond one chunk is ever held in memory.
+    """
+    cur = conn.cursor()
+    cur.row_factory = None  # plain tuples, cheaper than sqlite3.Row for a straight dump
+    cur.execute(sql)
+    yield [[d[0] for d in cur.description]]
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def stream_csv(conn, table: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """Yields CSV text one chunk of rows at a time."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for rows in iter_row_chunks(conn, EXPORT_QUERIES[table], chunk_size):
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+
+
+def stream_xlsx(conn, table: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yields an .xlsx file. openpyxl's write_only mode spools rows to disk as they are
+    appended, so memory stays flat; the finished zip is then streamed back in pieces.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=table.title())
+    for rows in iter_row_chunks(conn, EXPORT_QUERIES[table], chunk_size):
+        for row in rows:
+            ws.append(list(row))
+
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            data = tmp.read(FILE_CHUNK_SIZE)
+            if not data:
+                break
+            yield data
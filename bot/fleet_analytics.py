@@ -0,0 +1,125 @@
+"""
+Fleet-wide scan questions: busiest retailers, sudden drops, retailers gone quiet.
+
+Each report is one grouped query over scan_events followed by array operations on
+the result; nothing loops over retailers in Python.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _month_start(ts=None):
+    ts = pd.Timestamp.today() if ts is None else pd.Timestamp(ts)
+    return ts.normalize().replace(day=1)
+
+
+def _day(ts):
+    return ts.strftime("%Y-%m-%d")
+
+
+class FleetAnalytics:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def top_retailers(self, n=10, month=None):
+        """Retailers with the most scans in a month (default: this month)."""
+        start = _month_start(month)
+        end = start + pd.DateOffset(months=1)
+        return pd.read_sql_query(
+            """
+            SELECT MIN(retailer) AS retailer, COUNT(*) AS scans
+            FROM scan_events
+            WHERE scan_date >= ? AND scan_date < ?
+              AND retailer IS NOT NULL AND TRIM(retailer) != ''
+            GROUP BY LOWER(retailer)
+            ORDER BY scans DESC, retailer
+            LIMIT ?
+            """,
+            self.conn,
+            params=[_day(start), _day(end), int(n)],
+        )
+
+    def scan_drops(self, pct=50, trailing=3, month=None, min_average=2):
+        """
+        Retailers whose scans in `month` (default: last complete month) fell more than
+        pct% below their average over the `trailing` months before it. Retailers
+        averaging under min_average scans a month are too noisy to call and are skipped.
+        """
+        month = _month_start(month) if month is not None else _month_start() - pd.DateOffset(months=1)
+        start = month - pd.DateOffset(months=trailing)
+        end = month + pd.DateOffset(months=1)
+
+        monthly = pd.read_sql_query(
+            """
+            SELECT LOWER(retailer) AS rkey, MIN(retailer) AS retailer,
+                   strftime('%Y-%m', scan_date) AS ym, COUNT(*) AS scans
+            FROM scan_events
+            WHERE scan_date >= ? AND scan_date < ?
+              AND retailer IS NOT NULL AND TRIM(retailer) != ''
+            GROUP BY rkey, ym
+            """,
+            self.conn,
+            params=[_day(start), _day(end)],
+        )
+        columns = pd.date_range(start, month, freq="MS").strftime("%Y-%m")
+        if monthly.empty:
+            return pd.DataFrame(columns=["retailer", "trailing_average", "scans", "drop_pct"])
+
+        names = monthly.groupby("rkey")["retailer"].min()
+        counts = (
+            monthly.pivot_table(index="rkey", columns="ym", values="scans", aggfunc="sum", fill_value=0)
+            .reindex(columns=columns, fill_value=0)
+            .to_numpy(dtype=float)
+        )
+
+        average = counts[:, :-1].mean(axis=1)
+        current = counts[:, -1]
+        drop = np.where(average > 0, 100 * (1 - current / np.maximum(average, 1e-9)), 0.0)
+
+        result = pd.DataFrame({
+            "retailer": names.to_numpy(),
+            "trailing_average": average.round(1),
+            "scans": current.astype(int),
+            "drop_pct": drop.round(1),
+        })
+        result = result[(average >= min_average) & (drop > pct)]
+        return result.sort_values(["drop_pct", "trailing_average"], ascending=False).reset_index(drop=True)
+
+    def inactive_retailers(self, months=3):
+        """Retailers that have scanned before but not in the last `months` months."""
+        cutoff = pd.Timestamp.today().normalize() - pd.DateOffset(months=months)
+        result = pd.read_sql_query(
+            """
+            SELECT MIN(retailer) AS retailer, MAX(scan_date) AS last_scan
+            FROM scan_events
+            WHERE retailer IS NOT NULL AND TRIM(retailer) != ''
+            GROUP BY LOWER(retailer)
+            HAVING MAX(scan_date) < ?
+            """,
+            self.conn,
+            params=[_day(cutoff)],
+        )
+        last = pd.to_datetime(result["last_scan"], errors="coerce")
+        result["months_since"] = ((pd.Timestamp.today() - last).dt.days / 30.44).round(1)
+        return result.sort_values("last_scan").reset_index(drop=True)
+
+    def format_top_retailers(self, df, n):
+        if df.empty:
+            return "No scans recorded this month yet."
+        lines = [f"{i}. {row.retailer}: {row.scans}" for i, row in enumerate(df.itertuples(), 1)]
+        return f"Top {n} retailers by scans this month:\n" + "\n".join(lines)
+
+    def format_scan_drops(self, df, pct):
+        if df.empty:
+            return f"No retailers dropped more than {pct}% last month."
+        lines = [
+            f"{row.retailer}: {row.scans} scans vs {row.trailing_average:g} avg (-{row.drop_pct:g}%)"
+            for row in df.itertuples()
+        ]
+        return f"Retailers whose scans dropped more than {pct}% last month:\n" + "\n".join(lines)
+
+    def format_inactive_retailers(self, df, months):
+        if df.empty:
+            return f"Every retailer has scanned in the last {months} months."
+        lines = [f"{row.retailer}: last scan {str(row.last_scan)[:10]}" for row in df.itertuples()]
+        return f"Retailers with no scans in {months} months ({len(df)}):\n" + "\n".join(lines)
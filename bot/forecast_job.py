@@ -0,0 +1,112 @@
+"""
+Precompute scan forecasts for every retailer with scan data.
+
+Prophet fits are CPU-bound and single-threaded, so retailers are spread across a
+process pool. Workers only compute; the parent process is the single writer to
+forecast_cache, which the chat path then reads through ScanPredictor.predict_scans.
+
+    python -m bot.forecast_job --db retailers.db --months 12 --workers 4
+
+The NumPy engines don't need the pool: --fleet forecasts every retailer in one
+pass over a retailers x months matrix (ScanPredictor.predict_fleet).
+
+    python -m bot.forecast_job --db retailers.db --engine holt_winters --fleet
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bot.scan_pred import ScanPredictor
+
+
+def list_forecast_retailers(conn):
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT MIN(retailer)
+        FROM scan_events
+        WHERE retailer IS NOT NULL AND TRIM(retailer) != ''
+        GROUP BY LOWER(retailer)
+        ORDER BY LOWER(retailer)
+        """
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def _forecast_worker(db_path, retailer, months, engine):
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        start_month, fingerprint, predictions = ScanPredictor(conn, engine).compute_forecast(retailer, months)
+        return retailer, start_month, fingerprint, predictions, time.perf_counter() - t0, None
+    except Exception as e:
+        return retailer, None, None, None, time.perf_counter() - t0, f"{type(e).__name__}: {e}"
+    finally:
+        conn.close()
+
+
+def run_forecast_job(db_path, months=12, workers=None, retailers=None, engine=None):
+    """
+    Forecast every retailer (or the given subset) and store the results.
+    Returns a list of (retailer, seconds, error) rows, error is None on success.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    predictor = ScanPredictor(conn, engine)  # creates forecast_cache before the workers start
+    retailers = retailers or list_forecast_retailers(conn)
+
+    report = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_forecast_worker, db_path, r, months, engine) for r in retailers]
+        for fut in as_completed(futures):
+            retailer, start_month, fingerprint, predictions, elapsed, error = fut.result()
+            if error is None:
+                predictor.store_forecast(retailer, months, start_month, fingerprint, predictions)
+            report.append((retailer, elapsed, error))
+
+    conn.close()
+    return report
+
+
+def run_fleet_job(db_path, months=12, engine=None):
+    """Forecast and store every retailer in one vectorized pass. Returns the number of retailers."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        forecasts = ScanPredictor(conn, engine).predict_fleet(months, persist=True)
+        return forecasts["retailer"].nunique()
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute scan forecasts for all retailers.")
+    parser.add_argument("--db", default="retailers.db", help="path to retailers.db")
+    parser.add_argument("--months", type=int, default=12, help="forecast horizon to precompute")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--retailer", action="append", help="only forecast these retailers (repeatable)")
+    parser.add_argument("--engine", default=None, help="forecasting engine (default: RI_FORECAST_ENGINE)")
+    parser.add_argument("--fleet", action="store_true", help="forecast all retailers in one vectorized pass")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.fleet:
+        count = run_fleet_job(args.db, args.months, args.engine)
+        print(f"{count} retailers forecast in {time.perf_counter() - t0:.1f}s (fleet mode)")
+        return 0
+
+    report = run_forecast_job(args.db, args.months, args.workers, args.retailer, args.engine)
+    total = time.perf_counter() - t0
+
+    failures = [r for r in report if r[2]]
+    for retailer, elapsed, error in sorted(report, key=lambda r: -r[1]):
+        status = f"FAILED {error}" if error else "ok"
+        print(f"{retailer:<40} {elapsed:>8.2f}s  {status}")
+    print(f"\n{len(report) - len(failures)} of {len(report)} retailers forecast in {total:.1f}s with {args.workers} workers")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
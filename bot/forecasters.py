@@ -0,0 +1,227 @@
+"""
+Forecasting engines used by ScanPredictor.
+
+Every engine works on a matrix of monthly scan counts, one row per retailer,
+oldest month first. Rows may be left-padded with zeros before the retailer's
+first month; `lengths` says how many trailing months of each row are real
+history. A single retailer is just a one-row matrix.
+
+All engines share the existing damping: model output is blended 70/30 with the
+3-month rolling average, clipped to [0, 2x rolling], scaled by the activity
+factor and rounded. Retailers with less than a year of history get the plain
+rolling average x activity factor, same as before.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    from prophet import Prophet
+except ImportError:  # Prophet is optional; the NumPy engines cover the same ground
+    Prophet = None
+
+SEASON_LENGTH = 12
+MIN_MODEL_MONTHS = 12
+DEFAULT_ENGINE = os.environ.get("RI_FORECAST_ENGINE", "prophet")
+
+
+def _as_matrix(history, lengths):
+    history = np.atleast_2d(np.asarray(history, dtype=float))
+    if lengths is None:
+        lengths = np.full(history.shape[0], history.shape[1])
+    return history, np.asarray(lengths, dtype=int)
+
+
+def rolling_average(history, lengths, window=3):
+    """Mean of the last min(window, length) months of each row."""
+    history, lengths = _as_matrix(history, lengths)
+    n = history.shape[1]
+    k = np.minimum(window, lengths)
+    cols = np.arange(n)
+    mask = cols[None, :] >= (n - k)[:, None]
+    return np.where(k > 0, (history * mask).sum(axis=1) / np.maximum(k, 1), 0.0)
+
+
+def activity_factor(history, months_since_col):
+    """
+    Damp forecasts for retailers that have gone quiet.
+    months_since_col[i] is how many months have passed between column i and today.
+    """
+    history = np.atleast_2d(history)
+    n = history.shape[1]
+    nonzero = history > 0
+    active_months = nonzero.sum(axis=1)
+
+    avg_scans_per_month = np.where(active_months > 0, history.sum(axis=1) / np.maximum(active_months, 1), 0.0)
+
+    last_idx = (n - 1) - np.argmax(nonzero[:, ::-1], axis=1)
+    cols = np.arange(n)
+    window = (cols[None, :] >= (last_idx - 6)[:, None]) & (cols[None, :] <= last_idx[:, None])
+    scans_last_6m = (history * window).sum(axis=1)
+
+    months_since_last_scan = np.where(active_months > 0, np.asarray(months_since_col)[last_idx], np.inf)
+
+    return np.select(
+        [
+            (avg_scans_per_month >= 2) | (scans_last_6m >= 4),
+            scans_last_6m >= 2,
+            months_since_last_scan <= 3,
+        ],
+        [1.0, 0.8, 0.5],
+        default=0.3,
+    )
+
+
+def months_since_columns(n_months, end_month, today=None):
+    """Months elapsed between each history column's month start and today (30.44-day months)."""
+    today = pd.Timestamp.today() if today is None else pd.Timestamp(today)
+    col_months = pd.date_range(end=end_month, periods=n_months, freq="MS")
+    return np.asarray((today - col_months).days, dtype=float) / 30.44
+
+
+def seasonal_naive(history, lengths, first_step, horizon, season=SEASON_LENGTH):
+    """Repeat the same month from the most recent complete season."""
+    history, lengths = _as_matrix(history, lengths)
+    last = history.shape[1] - 1
+    steps = first_step + np.arange(horizon)
+    seasons_back = np.maximum(1, np.ceil((steps - last) / season)).astype(int)
+    return history[:, steps - season * seasons_back]
+
+
+def holt_winters(history, lengths, first_step, horizon, alpha=0.3, beta=0.05, gamma=0.2, season=SEASON_LENGTH):
+    """
+    Additive Holt-Winters with fixed smoothing constants, run for all rows at once.
+    Needs at least one season per row; the trend is only initialised from two.
+    """
+    history, lengths = _as_matrix(history, lengths)
+    m, n = history.shape
+    rows = np.arange(m)
+    start = n - lengths
+
+    first_idx = np.minimum(start[:, None] + np.arange(season), n - 1)
+    first = history[rows[:, None], first_idx]
+    level = first.mean(axis=1)
+
+    second_idx = np.minimum(start[:, None] + season + np.arange(season), n - 1)
+    second = history[rows[:, None], second_idx]
+    trend = np.where(lengths >= 2 * season, (second.mean(axis=1) - level) / season, 0.0)
+
+    seasonal = first - level[:, None]
+
+    for t in range(int(start.min()) + season, n):
+        active = t >= start + season
+        y = history[:, t]
+        s_idx = (t - start) % season
+        s_prev = seasonal[rows, s_idx]
+
+        new_level = alpha * (y - s_prev) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        new_season = gamma * (y - new_level) + (1 - gamma) * s_prev
+
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+        seasonal[rows, s_idx] = np.where(active, new_season, s_prev)
+
+    steps = first_step + np.arange(horizon)
+    ahead = np.maximum(steps - (n - 1), 0)
+    s_idx = (steps[None, :] - start[:, None]) % season
+    return level[:, None] + ahead[None, :] * trend[:, None] + seasonal[rows[:, None], s_idx]
+
+
+class Forecaster:
+    """
+    Base engine. Subclasses implement predict_raw (model output before damping);
+    forecast() applies the shared blend / clip / activity rules.
+    """
+    name = "base"
+    uses_model = True
+
+    def predict_raw(self, history, lengths, first_step, horizon, end_month):
+        raise NotImplementedError
+
+    def forecast(self, history, lengths, first_step, horizon, end_month, today=None):
+        """
+        history: (series, months) counts, lengths: real months per row,
+        first_step: column index of the first forecast month (n - 1 = the current history month).
+        Returns rounded predictions, shape (series, horizon).
+        """
+        history, lengths = _as_matrix(history, lengths)
+        rolling = rolling_average(history, lengths)
+        activity = activity_factor(history, months_since_columns(history.shape[1], end_month, today))
+
+        out = np.repeat(np.round(rolling * activity)[:, None], horizon, axis=1)
+
+        model_rows = lengths >= MIN_MODEL_MONTHS
+        if self.uses_model and model_rows.any():
+            raw = self.predict_raw(history[model_rows], lengths[model_rows], first_step, horizon, end_month)
+            r = rolling[model_rows][:, None]
+            yhat = 0.7 * raw + 0.3 * r
+            yhat = np.clip(yhat, 0, np.maximum(2 * r, 1))
+            yhat *= activity[model_rows][:, None]
+            out[model_rows] = np.round(yhat)
+
+        return out
+
+
+class RollingForecaster(Forecaster):
+    """The original fallback: 3-month rolling average x activity factor."""
+    name = "rolling"
+    uses_model = False
+
+
+class SeasonalNaiveForecaster(Forecaster):
+    name = "seasonal_naive"
+
+    def predict_raw(self, history, lengths, first_step, horizon, end_month):
+        return seasonal_naive(history, lengths, first_step, horizon)
+
+
+class HoltWintersForecaster(Forecaster):
+    name = "holt_winters"
+
+    def predict_raw(self, history, lengths, first_step, horizon, end_month):
+        return holt_winters(history, lengths, first_step, horizon)
+
+
+class ProphetForecaster(Forecaster):
+    """Per-series Prophet fit. Slow (seconds per retailer); needs the optional prophet package."""
+    name = "prophet"
+
+    def predict_raw(self, history, lengths, first_step, horizon, end_month):
+        n = history.shape[1]
+        dates = pd.date_range(end=end_month, periods=n, freq="MS")
+        future = pd.DataFrame({
+            "ds": pd.date_range(dates[0] + pd.DateOffset(months=int(first_step)), periods=horizon, freq="MS")
+        })
+
+        out = np.empty((history.shape[0], horizon))
+        for i, row in enumerate(history):
+            start = n - lengths[i]
+            try:
+                m = Prophet(yearly_seasonality=True, weekly_seasonality=False, daily_seasonality=False)
+                m.fit(pd.DataFrame({"ds": dates[start:], "y": row[start:]}))
+                out[i] = m.predict(future)["yhat"].to_numpy()
+            except Exception:
+                # Same fallback as before: rolling average only
+                out[i] = rolling_average(row[None, :], lengths[i:i + 1])[0]
+        return out
+
+
+ENGINES = {
+    cls.name: cls
+    for cls in (ProphetForecaster, HoltWintersForecaster, SeasonalNaiveForecaster, RollingForecaster)
+}
+
+
+def get_forecaster(name=None):
+    """
+    Engine by name, defaulting to RI_FORECAST_ENGINE.
+    Asking for prophet without the package installed falls back to holt_winters.
+    """
+    name = (name or DEFAULT_ENGINE).strip().lower()
+    if name not in ENGINES:
+        raise ValueError(f"Unknown forecast engine '{name}'. Choose from: {', '.join(ENGINES)}")
+    if name == ProphetForecaster.name and Prophet is None:
+        name = HoltWintersForecaster.name
+    return ENGINES[name]()
@@ -1,13 +1,51 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 import sqlite3
 
+from bot.metrics import INVENTORY_RESULTS
+from bot.tracing import traced
+
 ALLOWED_TYPES = {"iPad", "Sensor"}
-STATUS_IN_HOUSE = "inhouse"
+STATUS_IN_HOUSE = "in_house"
 STATUS_ASSIGNED = "assigned"
+STATUS_RETIRED = "retired"
 ALLWED_STATUSES = {STATUS_IN_HOUSE, STATUS_ASSIGNED}
 
+EVENT_ADD = "add"
+EVENT_CHECKOUT = "checkout"
+EVENT_CHECKIN = "checkin"
+EVENT_RETIRE = "retire"
+
+DEVICE_COLUMNS = """id, type, number, serial_number, model, ios_version, status, last_updated,
+       asset_tag, location, assigned_to, notes, version"""
+
+# Keep each IN (...) list well under SQLite's bound-parameter limit (codes are bound 3 times)
+BATCH_LOOKUP_CHUNK = 300
+
+
+def parse_scanned_codes(raw: Union[str, List[str], None]) -> List[str]:
+    """
+    Split a pasted/scanned block of barcodes (one per line, or comma/space separated)
+    into a de-duplicated list, keeping scan order.
+    """
+    if raw is None:
+        return []
+    if isinstance(raw, str):
+        parts = raw.replace(",", "\n").split()
+    else:
+        parts = [str(p) for p in raw]
+
+    codes: List[str] = []
+    seen = set()
+    for p in parts:
+        code = p.strip()
+        if code and code not in seen:
+            seen.add(code)
+            codes.append(code)
+    return codes
+
+@dataclass(frozen=True, slots=True)
 class Device:
     id: int
     type: str
@@ -21,57 +59,114 @@ class Device:
     location: Optional[str]
     assigned_to: Optional[str]
     notes: Optional[str]
+    version: int = 0
 
+    @property
     def scan_code(self) -> str:
         return (self.asset_tag or self.number or self.serial_number or "").strip()
     
+    @property
     def availability_label(self) -> str:
         if self.status == STATUS_IN_HOUSE:
             return "Avaliable"
+        if self.status == STATUS_RETIRED:
+            return "Retired"
         who = (self.assigned_to or "Unknown").strip()
         return f"Assigned to {who}"
     
+def device_row_factory(cursor: sqlite3.Cursor, row: Tuple[Any, ...]) -> Device:
+    """
+    Cursor row_factory for SELECT {DEVICE_COLUMNS} / RETURNING {DEVICE_COLUMNS}:
+    builds the Device straight from the raw tuple, no sqlite3.Row in between.
+    """
+    return Device(
+        row[0],
+        row[1],
+        row[2],
+        row[3],
+        row[4],
+        row[5],
+        (row[6] or "").strip() or STATUS_IN_HOUSE,
+        row[7],
+        row[8],
+        row[9],
+        row[10],
+        row[11],
+        row[12] or 0,
+    )
+
+
 class InventoryManager:
     def __init__(self, conn: sqlite3.Connection):
         self.conn = conn
+        self._ensure_columns()
+        self._ensure_event_log()
         self._ensure_indexes()
 
 
-    def _ensure_indexes(self) -> None:
+    def _ensure_columns(self) -> None:
         cur = self.conn.cursor()
-        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_asset_tag ON inventory(asset_tag)")
-        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_type_serial ON inventory(type, serial_number)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_inventory_status ON inventory(status)")
+        cols = {r[1] for r in cur.execute("PRAGMA table_info(inventory)").fetchall()}
+        if "version" not in cols:
+            # Bumped on every state transition; lets writers detect that a row changed under them
+            try:
+                cur.execute("ALTER TABLE inventory ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError as e:
+                # another connection migrated the table first
+                if "duplicate column" not in str(e):
+                    raise
+            self.conn.commit()
+
+        # Check-ins used to write 'inhouse'; rows from then (and blank ones, which the
+        # dashboard already shows as available) must match the status guards. Idempotent.
+        cur.execute(
+            """
+            UPDATE inventory
+            SET status = ?
+            WHERE status IS NULL
+               OR TRIM(status) = ''
+               OR LOWER(TRIM(status)) IN ('inhouse', 'in-house', 'in house')
+            """,
+            (STATUS_IN_HOUSE,),
+        )
         self.conn.commit()
 
 
-    def normalize_statuses(self) -> int:
+    def _ensure_event_log(self) -> None:
+        """
+        Append-only history of every state change. Rows are only ever inserted, in the same
+        transaction as the inventory UPDATE they describe.
+        """
         cur = self.conn.cursor()
         cur.execute(
             """
-            UPDATE inventory
-            SET status = CASE
-                WHEN status IS NULL OR TRIM(status) = '' THEN ?
-                WHEN LOWER(status) IN ('in house','in_house','available','ready','in stock','instock') THEN ?
-                WHEN LOWER(status) = 'assigned' THEN ?
-                WHEN LOWER(status) = 'inhouse' THEN ?
-                WHEN LOWER(status) = 'in-house' THEN ?
-                ELSE ?
-            END,
-            last_updated = CURRENT_TIMESTAMP
-            """,
-            (
-                STATUS_IN_HOUSE,
-                STATUS_IN_HOUSE,
-                STATUS_ASSIGNED,
-                STATUS_IN_HOUSE,
-                STATUS_IN_HOUSE,
-                STATUS_ASSIGNED,
-            ),
+            CREATE TABLE IF NOT EXISTS inventory_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                from_status TEXT,
+                to_status TEXT NOT NULL,
+                assigned_to TEXT,
+                location TEXT,
+                notes TEXT,
+                ts TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """
         )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_inventory_events_device_ts ON inventory_events(device_id, ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_inventory_events_assigned_ts ON inventory_events(assigned_to COLLATE NOCASE, ts)")
         self.conn.commit()
-        return cur.rowcount
-    
+
+
+    def _ensure_indexes(self) -> None:
+        cur = self.conn.cursor()
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_asset_tag ON inventory(asset_tag)")
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_type_serial ON inventory(type, serial_number)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_inventory_status ON inventory(status)")
+        self.conn.commit()
+
+
+    @traced("inventory_summary")
     def get_summary_counts(self) -> Dict[str, Dict[str, int]]:
         cur = self.conn.cursor()
         cur.execute(
@@ -102,13 +197,47 @@ class InventoryManager:
             out.setdefault(t, {"available": 0, "assigned": 0, "total": 0})
         return out
 
-    def list_ready_to_ship(self, limit: int = 50) -> List[Device]:
-        """Devices with status='in_house'."""
+    def _device_cursor(self) -> sqlite3.Cursor:
         cur = self.conn.cursor()
+        cur.row_factory = device_row_factory
+        return cur
+
+    def iter_devices(self, status: Optional[str] = None, device_type: Optional[str] = None, chunk_size: int = 500) -> Iterator[Device]:
+        """
+        Stream the inventory in id order, fetching chunk_size rows at a time,
+        so listing the full table never holds more than one chunk in memory.
+        """
+        where = []
+        params: List[Any] = []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if device_type:
+            where.append("type = ?")
+            params.append(device_type)
+
+        cur = self._device_cursor()
         cur.execute(
-            """
-            SELECT id, type, number, serial_number, model, ios_version, status, last_updated,
-                   asset_tag, location, assigned_to, notes
+            f"""
+            SELECT {DEVICE_COLUMNS}
+            FROM inventory
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY id
+            """,
+            params,
+        )
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield from chunk
+
+    def iter_ready_to_ship(self, limit: int = 50) -> Iterator[Device]:
+        """Devices with status='in_house'."""
+        cur = self._device_cursor()
+        cur.execute(
+            f"""
+            SELECT {DEVICE_COLUMNS}
             FROM inventory
             WHERE status = ?
             ORDER BY type, id DESC
@@ -116,7 +245,7 @@ class InventoryManager:
             """,
             (STATUS_IN_HOUSE, int(limit)),
         )
-        return [self._row_to_device(r) for r in cur.fetchall()]
+        yield from cur
 
     def lookup_device(self, code: str) -> Optional[Device]:
         """
@@ -129,11 +258,10 @@ class InventoryManager:
         if not code:
             return None
 
-        cur = self.conn.cursor()
+        cur = self._device_cursor()
         cur.execute(
-            """
-            SELECT id, type, number, serial_number, model, ios_version, status, last_updated,
-                   asset_tag, location, assigned_to, notes
+            f"""
+            SELECT {DEVICE_COLUMNS}
             FROM inventory
             WHERE asset_tag = ?
                OR number = ?
@@ -142,41 +270,79 @@ class InventoryManager:
             """,
             (code, code, code),
         )
-        row = cur.fetchone()
-        return self._row_to_device(row) if row else None
+        return cur.fetchone()
 
-    def check_out(self, code: str, assigned_to: str, location: Optional[str] = None, notes: Optional[str] = None) -> Tuple[bool, str]:
+    def _transition(self, where: str, where_params: Tuple[Any, ...], from_status: str, to_status: str, assigned_to: Optional[str], location: Optional[str], notes: Optional[str]) -> Optional[Device]:
         """
-        Mark device as assigned.
+        Move one device from from_status to to_status in a single statement.
+        The status guard in the WHERE clause enforces the transition (a blank status counts as
+        in-house, as device_row_factory reads it), version is bumped,
+        and RETURNING hands back the updated row, so there is no read-then-write window.
+        Returns None when no row matched (unknown device, or it was no longer in from_status).
+        The matching inventory_events row is written in the same transaction, which the caller owns.
         """
-        code = (code or "").strip()
-        assigned_to = (assigned_to or "").strip()
-        if not code or not assigned_to:
-            return False, "Please scan a device and enter who it’s assigned to."
-
-        dev = self.lookup_device(code)
-        if not dev:
-            return False, f"Device not found for code: {code}"
-
-        if dev.status != STATUS_IN_HOUSE:
-            return False, f"{dev.type} {dev.scan_code} is not in-house (currently: {dev.availability_label})."
-
-        cur = self.conn.cursor()
+        cur = self._device_cursor()
         cur.execute(
-            """
+            f"""
             UPDATE inventory
             SET status = ?,
                 assigned_to = ?,
                 location = COALESCE(?, location),
                 notes = COALESCE(?, notes),
+                version = version + 1,
                 last_updated = CURRENT_TIMESTAMP
-            WHERE id = ?
+            WHERE {where}
+              AND COALESCE(NULLIF(TRIM(status), ''), ?) = ?
+            RETURNING {DEVICE_COLUMNS}
             """,
-            (STATUS_ASSIGNED, assigned_to, location, notes, dev.id),
+            (to_status, assigned_to, location, notes, *where_params, STATUS_IN_HOUSE, from_status),
         )
-        self.conn.commit()
+        rows = cur.fetchall()
+        if not rows:
+            return None
+
+        dev = rows[0]
+        event = EVENT_CHECKOUT if to_status == STATUS_ASSIGNED else EVENT_CHECKIN
+        self._record_event(dev.id, event, from_status, to_status, dev.assigned_to, dev.location, notes)
+        return dev
 
-        return True, f"✓ Checked out {dev.type} {dev.scan_code} to {assigned_to}."
+    def _record_event(self, device_id: int, event: str, from_status: Optional[str], to_status: str, assigned_to: Optional[str], location: Optional[str], notes: Optional[str]) -> None:
+        """Append one row to inventory_events. Caller owns the transaction."""
+        self.conn.execute(
+            """
+            INSERT INTO inventory_events (device_id, event, from_status, to_status, assigned_to, location, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (device_id, event, from_status, to_status, assigned_to, location, notes),
+        )
+
+    def _transition_code(self, code: str, from_status: str, to_status: str, assigned_to: Optional[str], location: Optional[str], notes: Optional[str]) -> Optional[Device]:
+        return self._transition(
+            "id = (SELECT id FROM inventory WHERE asset_tag = ? OR number = ? OR serial_number = ? LIMIT 1)",
+            (code, code, code),
+            from_status, to_status, assigned_to, location, notes,
+        )
+
+    def check_out(self, code: str, assigned_to: str, location: Optional[str] = None, notes: Optional[str] = None) -> Tuple[bool, str]:
+        """
+        Mark device as assigned.
+        """
+        code = (code or "").strip()
+        assigned_to = (assigned_to or "").strip()
+        if not code or not assigned_to:
+            return False, "Please scan a device and enter who it’s assigned to."
+
+        with self.conn:
+            dev = self._transition_code(code, STATUS_IN_HOUSE, STATUS_ASSIGNED, assigned_to, location, notes)
+
+        if dev:
+            return True, f"✓ Checked out {dev.type} {dev.scan_code} to {assigned_to}."
+
+        # Failure path only: find out why the guarded update didn't match
+        current = self.lookup_device(code)
+        if not current:
+            return False, f"Device not found for code: {code}"
+        return False, f"{current.type} {current.scan_code} is not in-house (currently: {current.availability_label})."
 
     def check_in(self, code: str, location: str = "HQ", notes: Optional[str] = None) -> Tuple[bool, str]:
         """
@@ -187,26 +353,220 @@ class InventoryManager:
         if not code:
             return False, "Please scan a device."
 
+        with self.conn:
+            dev = self._transition_code(code, STATUS_ASSIGNED, STATUS_IN_HOUSE, None, location, notes)
+
+        if dev:
+            return True, f"✓ Checked in {dev.type} {dev.scan_code}. Marked in_house at {location}."
+
+        current = self.lookup_device(code)
+        if not current:
+            return False, f"Device not found for code: {code}"
+        return False, f"{current.type} {current.scan_code} is not checked out (currently: {current.availability_label})."
+
+    # ---------------------------
+    # Batch scanning
+    # ---------------------------
+
+    @traced("inventory_lookup")
+    def lookup_devices(self, codes: List[str]) -> Dict[str, Device]:
+        """
+        Resolve many scanned codes at once. Same matching rules as lookup_device,
+        but one IN (...) query per chunk instead of one query per code.
+        Returns {code: Device} for the codes that matched.
+        """
+        codes = [c for c in (str(c).strip() for c in codes or []) if c]
+        found: Dict[str, Device] = {}
+        cur = self._device_cursor()
+
+        for i in range(0, len(codes), BATCH_LOOKUP_CHUNK):
+            chunk = codes[i:i + BATCH_LOOKUP_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            cur.execute(
+                f"""
+                SELECT {DEVICE_COLUMNS}
+                FROM inventory
+                WHERE asset_tag IN ({marks})
+                   OR number IN ({marks})
+                   OR serial_number IN ({marks})
+                """,
+                (*chunk, *chunk, *chunk),
+            )
+            wanted = set(chunk)
+            for dev in cur:
+                for key in (dev.asset_tag, dev.number, dev.serial_number):
+                    if key in wanted:
+                        found.setdefault(key, dev)
+        return found
+
+    def check_out_many(self, codes: List[str], assigned_to: str, location: Optional[str] = None, notes: Optional[str] = None) -> List[Tuple[str, bool, str]]:
+        """
+        Check out a whole batch of scanned devices to one assignee.
+        All updates run in a single transaction; each one is conditional on the
+        device still being in house, so a device can't be double-assigned.
+        Returns (code, ok, message) per scanned code.
+        """
+        assigned_to = (assigned_to or "").strip()
+        codes = parse_scanned_codes(codes)
+        if not codes or not assigned_to:
+            return [("", False, "Please scan at least one device and enter who it’s assigned to.")]
+
+        devices = self.lookup_devices(codes)
+        results: List[Tuple[str, bool, str]] = []
+        done_ids = set()
+
+        with self.conn:
+            for code in codes:
+                dev = devices.get(code)
+                if not dev:
+                    results.append((code, False, f"Device not found for code: {code}"))
+                    continue
+                if dev.id in done_ids:
+                    results.append((code, False, f"{dev.type} {dev.scan_code} was already scanned in this batch."))
+                    continue
+                done_ids.add(dev.id)
+
+                if self._transition("id = ?", (dev.id,), STATUS_IN_HOUSE, STATUS_ASSIGNED, assigned_to, location, notes):
+                    results.append((code, True, f"✓ Checked out {dev.type} {dev.scan_code} to {assigned_to}."))
+                else:
+                    results.append((code, False, f"{dev.type} {dev.scan_code} is not in-house (currently: {dev.availability_label})."))
+
+        return results
+
+    def check_in_many(self, codes: List[str], location: str = "HQ", notes: Optional[str] = None) -> List[Tuple[str, bool, str]]:
+        """
+        Check a whole batch of scanned devices back in, in a single transaction.
+        Only devices that are currently assigned are updated.
+        Returns (code, ok, message) per scanned code.
+        """
+        location = (location or "HQ").strip()
+        codes = parse_scanned_codes(codes)
+        if not codes:
+            return [("", False, "Please scan at least one device.")]
+
+        devices = self.lookup_devices(codes)
+        results: List[Tuple[str, bool, str]] = []
+        done_ids = set()
+
+        with self.conn:
+            for code in codes:
+                dev = devices.get(code)
+                if not dev:
+                    results.append((code, False, f"Device not found for code: {code}"))
+                    continue
+                if dev.id in done_ids:
+                    results.append((code, False, f"{dev.type} {dev.scan_code} was already scanned in this batch."))
+                    continue
+                done_ids.add(dev.id)
+
+                if self._transition("id = ?", (dev.id,), STATUS_ASSIGNED, STATUS_IN_HOUSE, None, location, notes):
+                    results.append((code, True, f"✓ Checked in {dev.type} {dev.scan_code} at {location}."))
+                else:
+                    results.append((code, False, f"{dev.type} {dev.scan_code} is not checked out (currently: {dev.availability_label})."))
+
+        return results
+
+    def _record_results(self, action: str, results: List[Tuple[str, bool, str]]) -> None:
+        for _, ok, _ in results:
+            INVENTORY_RESULTS.inc(action, "ok" if ok else "failed")
+
+    def _batch_response(self, action: str, results: List[Tuple[str, bool, str]], is_admin: bool = False) -> Dict[str, Any]:
+        ok_count = sum(1 for _, ok, _ in results if ok)
+        lines = [msg if ok else f"⚠ {msg}" for _, ok, msg in results]
+        return {
+            "text": f"{action} {ok_count} of {len(results)} scanned device(s).\n" + "\n".join(lines),
+            "results": [{"code": code, "ok": ok, "message": msg} for code, ok, msg in results],
+            "reply": self.dashboard_form(is_admin=is_admin),
+        }
+
+    # ---------------------------
+    # History
+    # ---------------------------
+
+    @traced("inventory_history")
+    def device_history(self, code: str, limit: int = 50) -> Tuple[Optional[Device], List[sqlite3.Row]]:
+        """Events for one scanned device, newest first (served by idx_inventory_events_device_ts)."""
         dev = self.lookup_device(code)
         if not dev:
-            return False, f"Device not found for code: {code}"
+            return None, []
 
         cur = self.conn.cursor()
         cur.execute(
             """
-            UPDATE inventory
-            SET status = ?,
-                assigned_to = NULL,
-                location = ?,
-                notes = COALESCE(?, notes),
-                last_updated = CURRENT_TIMESTAMP
-            WHERE id = ?
+            SELECT event, from_status, to_status, assigned_to, location, notes, ts
+            FROM inventory_events
+            WHERE device_id = ?
+            ORDER BY ts DESC, id DESC
+            LIMIT ?
             """,
-            (STATUS_IN_HOUSE, location, notes, dev.id),
+            (dev.id, int(limit)),
         )
-        self.conn.commit()
+        return dev, cur.fetchall()
 
-        return True, f"✓ Checked in {dev.type} {dev.scan_code}. Marked in_house at {location}."
+    @traced("inventory_received")
+    def devices_received_by(self, assigned_to: str, limit: int = 100) -> List[sqlite3.Row]:
+        """Check-outs to one retailer/person, newest first (served by idx_inventory_events_assigned_ts)."""
+        assigned_to = (assigned_to or "").strip()
+        if not assigned_to:
+            return []
+
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            SELECT e.ts, e.location, e.notes, i.type, i.asset_tag, i.number, i.serial_number, i.model, i.status
+            FROM inventory_events e
+            JOIN inventory i ON i.id = e.device_id
+            WHERE e.assigned_to = ? COLLATE NOCASE
+              AND e.event = ?
+            ORDER BY e.ts DESC, e.id DESC
+            LIMIT ?
+            """,
+            (assigned_to, EVENT_CHECKOUT, int(limit)),
+        )
+        return cur.fetchall()
+
+    def format_device_history(self, code: str) -> str:
+        dev, events = self.device_history(code)
+        if not dev:
+            return f"Device not found for code: {code}"
+        if not events:
+            return f"No recorded history for {dev.type} {dev.scan_code} yet ({dev.availability_label})."
+
+        lines = []
+        for e in events:
+            if e["event"] == EVENT_CHECKOUT:
+                line = f"Checked out to {e['assigned_to']}"
+            elif e["event"] == EVENT_CHECKIN:
+                line = "Checked in"
+            elif e["event"] == EVENT_RETIRE:
+                line = "Retired"
+            else:
+                line = "Added to inventory"
+            if e["location"]:
+                line += f" at {e['location']}"
+            if e["notes"]:
+                line += f" ({e['notes']})"
+            lines.append(f"{e['ts']}: {line}")
+
+        return f"History for {dev.type} {dev.scan_code} ({dev.availability_label}):\n" + "\n".join(lines)
+
+    def format_devices_received(self, assigned_to: str) -> str:
+        rows = self.devices_received_by(assigned_to)
+        if not rows:
+            return f"No devices have been checked out to {assigned_to}."
+
+        lines = []
+        for r in rows:
+            code = (r["asset_tag"] or r["number"] or r["serial_number"] or "").strip()
+            parts = [r["type"], code]
+            if r["model"]:
+                parts.append(r["model"])
+            line = f"{r['ts']}: " + " • ".join(p for p in parts if p)
+            if r["status"] != STATUS_ASSIGNED:
+                line += f" (now {r['status']})"
+            lines.append(line)
+
+        return f"Devices received by {assigned_to}:\n" + "\n".join(lines)
 
     # ---------------------------
     # Session forms
@@ -218,7 +578,7 @@ class InventoryManager:
         Frontend can render title, stats, and list.
         """
         summary = self.get_summary_counts()
-        ready = self.list_ready_to_ship(limit=50)
+        ready = self.iter_ready_to_ship(limit=50)
         gen_breakdown = self.get_ipad_gen()
 
         # Flatten ready list into friendly lines for simple rendering
@@ -241,6 +601,10 @@ class InventoryManager:
         buttons = [
                 {"text": "Check Out", "action": "open_form", "target": "inventory_checkout"},
                 {"text": "Check In", "action": "open_form", "target": "inventory_checkin"},
+                {"text": "Batch Check Out", "action": "open_form", "target": "inventory_batch_checkout"},
+                {"text": "Batch Check In", "action": "open_form", "target": "inventory_batch_checkin"},
+                {"text": "Device History", "action": "open_form", "target": "inventory_device_history"},
+                {"text": "Devices Received", "action": "open_form", "target": "inventory_received"},
                 {"text": "Refresh", "action": "submit"},
                 {"text": "Exit", "action": "exit"},
             ]
@@ -351,7 +715,123 @@ class InventoryManager:
             ],
         }
 
-    def handle_form_submission(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+    def batch_checkout_form(self) -> Dict[str, Any]:
+        return {
+            "type": "session form",
+            "form_id": "inventory_batch_checkout",
+            "title": "Batch Check Out Devices",
+            "fields": [
+                {
+                    "name": "codes",
+                    "type": "textarea",
+                    "label": "Scan device barcodes (one per line)",
+                    "placeholder": "Scan now...",
+                    "options": [],
+                },
+                {
+                    "name": "assigned_to",
+                    "type": "text",
+                    "label": "Assigned to",
+                    "placeholder": "Retailer or coworker name/email",
+                    "options": [],
+                },
+                {
+                    "name": "location",
+                    "type": "text",
+                    "label": "Location (optional)",
+                    "placeholder": "HQ / Warehouse / etc",
+                    "options": [],
+                },
+                {
+                    "name": "notes",
+                    "type": "text",
+                    "label": "Notes (optional)",
+                    "placeholder": "Any quick note",
+                    "options": [],
+                },
+            ],
+            "buttons": [
+                {"text": "Check Out All", "action": "submit"},
+                {"text": "Cancel", "action": "exit"},
+            ],
+        }
+
+    def batch_checkin_form(self) -> Dict[str, Any]:
+        return {
+            "type": "session form",
+            "form_id": "inventory_batch_checkin",
+            "title": "Batch Check In Devices",
+            "fields": [
+                {
+                    "name": "codes",
+                    "type": "textarea",
+                    "label": "Scan device barcodes (one per line)",
+                    "placeholder": "Scan now...",
+                    "options": [],
+                },
+                {
+                    "name": "location",
+                    "type": "text",
+                    "label": "Location",
+                    "placeholder": "HQ",
+                    "options": [],
+                },
+                {
+                    "name": "notes",
+                    "type": "text",
+                    "label": "Notes (optional)",
+                    "placeholder": "Any quick note",
+                    "options": [],
+                },
+            ],
+            "buttons": [
+                {"text": "Check In All", "action": "submit"},
+                {"text": "Cancel", "action": "exit"},
+            ],
+        }
+
+    def device_history_form(self) -> Dict[str, Any]:
+        return {
+            "type": "session form",
+            "form_id": "inventory_device_history",
+            "title": "Device History",
+            "fields": [
+                {
+                    "name": "code",
+                    "type": "text",
+                    "label": "Scan or enter device barcode",
+                    "placeholder": "Scan now...",
+                    "options": [],
+                },
+            ],
+            "buttons": [
+                {"text": "Show History", "action": "submit"},
+                {"text": "Cancel", "action": "exit"},
+            ],
+        }
+
+    def devices_received_form(self) -> Dict[str, Any]:
+        return {
+            "type": "session form",
+            "form_id": "inventory_received",
+            "title": "Devices Received",
+            "fields": [
+                {
+                    "name": "assigned_to",
+                    "type": "text",
+                    "label": "Retailer or person",
+                    "placeholder": "Retailer or coworker name/email",
+                    "options": [],
+                },
+            ],
+            "buttons": [
+                {"text": "Show Devices", "action": "submit"},
+                {"text": "Cancel", "action": "exit"},
+            ],
+        }
+
+    @traced("inventory_form")
+    def handle_form_submission(self, payload: Dict[str, Any], is_admin: bool = False) -> Dict[str, Any]:
         """
         Call this from your RetailBot.handle_form_submission when form_id matches inventory_*.
         Returns a response dict (usually {"text": "..."} or {"reply": <form>}).
@@ -360,7 +840,40 @@ class InventoryManager:
         data = payload.get("data", {}) or {}
 
         if form_id == "inventory_dashboard":
-            return {"reply": self.dashboard_form()}
+            return {"reply": self.dashboard_form(is_admin=is_admin)}
+
+        if form_id == "inventory_device_history":
+            return {
+                "text": self.format_device_history(str(data.get("code", "")).strip()),
+                "history": True,
+                "reply": self.dashboard_form(is_admin=is_admin),
+            }
+
+        if form_id == "inventory_received":
+            return {
+                "text": self.format_devices_received(str(data.get("assigned_to", "")).strip()),
+                "history": True,
+                "reply": self.dashboard_form(is_admin=is_admin),
+            }
+
+        if form_id == "inventory_batch_checkout":
+            results = self.check_out_many(
+                codes=data.get("codes"),
+                assigned_to=str(data.get("assigned_to", "")),
+                location=(str(data.get("location")) if data.get("location") else None),
+                notes=(str(data.get("notes")) if data.get("notes") else None),
+            )
+            self._record_results(EVENT_CHECKOUT, results)
+            return self._batch_response("Checked out", results, is_admin=is_admin)
+
+        if form_id == "inventory_batch_checkin":
+            results = self.check_in_many(
+                codes=data.get("codes"),
+                location=str(data.get("location") or "HQ"),
+                notes=(str(data.get("notes")) if data.get("notes") else None),
+            )
+            self._record_results(EVENT_CHECKIN, results)
+            return self._batch_response("Checked in", results, is_admin=is_admin)
 
         if form_id == "inventory_checkout":
             ok, msg = self.check_out(
@@ -369,7 +882,8 @@ class InventoryManager:
                 location=(str(data.get("location")) if data.get("location") is not None else None),
                 notes=(str(data.get("notes")) if data.get("notes") is not None else None),
             )
-            return {"text": msg, "reply": self.dashboard_form()} if ok else {"text": f"⚠ {msg}"}
+            self._record_results(EVENT_CHECKOUT, [("", ok, msg)])
+            return {"text": msg, "reply": self.dashboard_form(is_admin=is_admin)} if ok else {"text": f"⚠ {msg}"}
 
         if form_id == "inventory_checkin":
             ok, msg = self.check_in(
@@ -377,7 +891,8 @@ class InventoryManager:
                 location=str(data.get("location") or "HQ"),
                 notes=(str(data.get("notes")) if data.get("notes") is not None else None),
             )
-            return {"text": msg, "reply": self.dashboard_form()} if ok else {"text": f"⚠ {msg}"}
+            self._record_results(EVENT_CHECKIN, [("", ok, msg)])
+            return {"text": msg, "reply": self.dashboard_form(is_admin=is_admin)} if ok else {"text": f"⚠ {msg}"}
 
         return {"text": "Unknown inventory form submission."}
     
@@ -406,46 +921,6 @@ class InventoryManager:
         return break_down
         
 
-    def _row_to_device(self, row: Any) -> Device:
-        """
-        Supports sqlite3.Row or tuple.
-        """
-        if row is None:
-            raise ValueError("row is None")
-
-        
-        if hasattr(row, "keys"):
-            return Device(
-                id=int(row["id"]),
-                type=str(row["type"]),
-                number=row["number"],
-                serial_number=str(row["serial_number"]),
-                model=row["model"],
-                ios_version=row["ios_version"],
-                status=str(row["status"] or "").strip() or STATUS_IN_HOUSE,
-                last_updated=str(row["last_updated"]) if row["last_updated"] is not None else None,
-                asset_tag=row["asset_tag"],
-                location=row["location"],
-                assigned_to=row["assigned_to"],
-                notes=row["notes"],
-            )
-
-       
-        return Device(
-            id=int(row[0]),
-            type=str(row[1]),
-            number=row[2],
-            serial_number=str(row[3]),
-            model=row[4],
-            ios_version=row[5],
-            status=str(row[6] or "").strip() or STATUS_IN_HOUSE,
-            last_updated=str(row[7]) if row[7] is not None else None,
-            asset_tag=row[8],
-            location=row[9],
-            assigned_to=row[10],
-            notes=row[11],
-        )
-
     def add_device_form(self) -> Dict[str, Any]:
         return {
             "type": "session form",
@@ -546,14 +1021,15 @@ class InventoryManager:
         assigned_to = None
 
         try:
-            cur.execute(
-                """
-                INSERT INTO inventory (type, number, serial_number, model, ios_version, status, last_updated, asset_tag, location, assigned_to, notes)
-                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?)
-                """,
-                (dtype, number, serial, model, ios_version, status, asset_tag, location, assigned_to, notes),
-            )
-            self.conn.commit()
+            with self.conn:
+                cur.execute(
+                    """
+                    INSERT INTO inventory (type, number, serial_number, model, ios_version, status, last_updated, asset_tag, location, assigned_to, notes)
+                    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?)
+                    """,
+                    (dtype, number, serial, model, ios_version, status, asset_tag, location, assigned_to, notes),
+                )
+                self._record_event(cur.lastrowid, EVENT_ADD, None, status, None, location, notes)
         except Exception as e:
             return {"text": f"⚠ Failed to add device: {e}"}
 
@@ -570,28 +1046,29 @@ class InventoryManager:
         if not row:
             return {"text": "❌ Device not found."}
 
-        if (row["status"] or "").lower() == "assigned":
+        status = (row["status"] or "").lower()
+        if status == STATUS_RETIRED:
+            return {"text": f"⚠ {row['type']} ({row['asset_tag'] or row['serial_number']}) is already retired."}
+        if status == "assigned":
             return {"text": "❌ This device is assigned. Check it in first before retiring."}
 
-        note_line = "Retired"
-        if reason:
-            note_line += f": {reason}"
-
         cur = self.conn.cursor()
-        cur.execute(
-            """
-            UPDATE inventory
-            SET status = 'retired',
-                notes = CASE
-                    WHEN notes IS NULL OR notes = '' THEN ?
-                    ELSE notes || char(10) || ?
-                END,
-                last_updated = CURRENT_TIMESTAMP
-            WHERE id = ?
-            """,
-            (note_line, note_line, row["id"]),
-        )
-        self.conn.commit()
+        with self.conn:
+            # The reason goes into the event log rather than being appended to notes
+            cur.execute(
+                """
+                UPDATE inventory
+                SET status = ?,
+                    version = version + 1,
+                    last_updated = CURRENT_TIMESTAMP
+                WHERE id = ?
+                  AND status IS ?
+                """,
+                (STATUS_RETIRED, row["id"], row["status"]),
+            )
+            if not cur.rowcount:
+                return {"text": "❌ Device changed while retiring it. Please try again."}
+            self._record_event(row["id"], EVENT_RETIRE, row["status"], STATUS_RETIRED, None, row["location"], reason or None)
 
         return {"text": f"✓ Retired {row['type']} ({row['asset_tag'] or row['serial_number']})"}
 
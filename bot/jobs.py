@@ -0,0 +1,141 @@
+"""
+Background jobs for slow bot operations (forecasts, history charts, parcel shippers).
+
+Jobs run on a bounded thread pool so the web workers stay free; their state lives
+in the jobs table so /jobs/<id> can report it from any request. A job's function
+returns a reply like the ones RetailBot returns; result_hook(result, job) (set by
+the app) turns it into something JSON-safe, e.g. moving files into the artifact
+store. current_user, if given, is called at submit time to record who asked.
+
+Job functions must not touch the bot's shared connection: open one of your own.
+They should also finish their own slow work (e.g. render charts) rather than leave
+it for the request that fetches the result; /jobs/<id> only reads the stored reply.
+
+    RI_JOB_WORKERS   concurrent jobs (default 2)
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from bot.tracing import span
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("RI_JOB_WORKERS", "2"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobQueue:
+    def __init__(self, db_path, workers=JOB_WORKERS, result_hook=None, current_user=None):
+        self.db_path = db_path
+        self.result_hook = result_hook
+        self.current_user = current_user
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._ensure_table()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout=5000;")
+        return conn
+
+    def _ensure_table(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        username TEXT,
+                        description TEXT,
+                        result TEXT,
+                        error TEXT,
+                        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        started_at TEXT,
+                        finished_at TEXT
+                    )
+                    """
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+                # Work from a previous process can't be resumed: its closures are gone
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = 'interrupted by restart', finished_at = CURRENT_TIMESTAMP WHERE status IN (?, ?)",
+                    (STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING),
+                )
+        finally:
+            conn.close()
+
+    def _update(self, job_id, **fields):
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+        finally:
+            conn.close()
+
+    def _run(self, job, fn, args):
+        job_id = job["id"]
+        self._update(job_id, status=STATUS_RUNNING, started_at=time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()))
+        try:
+            # Pool threads don't inherit the request's context, so each job is a trace of its own
+            with span("job", kind=job["kind"], job_id=job_id):
+                result = fn(*args)
+                if self.result_hook:
+                    result = self.result_hook(result, job)
+            self._update(
+                job_id,
+                status=STATUS_DONE,
+                result=json.dumps(result, default=str),
+                finished_at=time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            )
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            self._update(
+                job_id,
+                status=STATUS_FAILED,
+                error=f"{type(e).__name__}: {e}",
+                finished_at=time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            )
+
+    def submit(self, kind, fn, *args, username=None, description=None):
+        """Queue fn(*args); returns the job id."""
+        job_id = uuid.uuid4().hex
+        if username is None and self.current_user:
+            username = self.current_user()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, status, username, description) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, kind, STATUS_QUEUED, username, description),
+                )
+        finally:
+            conn.close()
+        job = {"id": job_id, "kind": kind, "username": username, "description": description}
+        self._pool.submit(self._run, job, fn, args)
+        return job_id
+
+    def get(self, job_id):
+        """Job row as a dict (result decoded), or None."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
@@ -0,0 +1,12 @@
+"""
+Masking for values that end up in logs (retailer names, usernames, passwords,
+query parameters). No dependencies, so both the matchers and the DB layer can
+use it.
+"""
+
+
+def mask_value_for_debug(user_input):
+    s = str(user_input)
+    if len(s) <= 4:
+        return "*" * len(s)
+    return s[:2] + "*" * (len(s) - 4) + s[-2:]
@@ -0,0 +1,145 @@
+"""
+Aggregated counters and latency histograms, exported in Prometheus text format
+at /admin/metrics.
+
+Histograms use fixed buckets: a label set's bucket array is created the first
+time it is seen and after that an observation is a bisect and three integer
+increments under a lock. Every span from bot.tracing is timed into
+ri_stage_seconds, and each chat trace into ri_chat_seconds by routed intent, so
+instrumented code only has to open spans; the rest (matcher scores, cache
+hits, inventory results) is recorded where it happens.
+"""
+import threading
+from bisect import bisect_left
+
+from bot import tracing
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _labels(self.labelnames, k), v) for k, v in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, (list(s[0]), s[1], s[2])) for k, s in self._series.items())
+        out = []
+        for labels, (counts, total, count) in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = "+Inf" if bound == float("inf") else _number(float(bound))
+                out.append((f"{self.name}_bucket", _labels(self.labelnames, labels, f'le="{le}"'), running))
+            out.append((f"{self.name}_sum", _labels(self.labelnames, labels), total))
+            out.append((f"{self.name}_count", _labels(self.labelnames, labels), count))
+        return out
+
+
+def render():
+    """Every registered metric in Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+CHAT_REQUESTS = Counter("ri_chat_requests_total", "Chat messages handled, by routed intent.", ["intent"])
+CHAT_ERRORS = Counter("ri_chat_errors_total", "Chat messages that raised, by routed intent.", ["intent"])
+CHAT_SECONDS = Histogram("ri_chat_seconds", "End-to-end chat handling time by routed intent.", ["intent"])
+STAGE_SECONDS = Histogram("ri_stage_seconds", "Time spent in each traced stage (handler, matcher, render, job).", ["stage"])
+SQL_SECONDS = Histogram("ri_sql_seconds", "SQLite query time by query.", ["query"])
+JOB_SECONDS = Histogram("ri_job_seconds", "Background job run time by kind.", ["kind"])
+FORECAST_SECONDS = Histogram("ri_forecast_seconds", "Forecast model fit and predict time by engine.", ["engine"])
+MATCH_SCORE = Histogram("ri_match_score", "Best match score (0-1) by matcher.", ["matcher"], buckets=SCORE_BUCKETS)
+SLOW_QUERIES = Counter("ri_sql_slow_total", "Statements slower than RI_SLOW_QUERY_MS, by plan (full_scan/indexed).", ["kind"])
+CACHE_REQUESTS = Counter("ri_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"])
+CACHE_EVICTIONS = Counter("ri_cache_evictions_total", "Entries evicted to stay under a cache's size cap.", ["cache"])
+INVENTORY_RESULTS = Counter("ri_inventory_devices_total", "Devices processed by inventory action and outcome.", ["action", "result"])
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+def _observe_span(s):
+    STAGE_SECONDS.observe(s.elapsed, s.name)
+    if s.name == "sql":
+        SQL_SECONDS.observe(s.elapsed, s.attrs.get("query", ""))
+    elif s.name == "forecast_fit":
+        FORECAST_SECONDS.observe(s.elapsed, s.attrs.get("engine", ""))
+    elif s.name == "job":
+        JOB_SECONDS.observe(s.elapsed, s.attrs.get("kind", ""))
+    elif s.name == "chat" and s.parent is None:
+        intent = s.attrs.get("intent", "unknown")
+        CHAT_REQUESTS.inc(intent)
+        CHAT_SECONDS.observe(s.elapsed, intent)
+        if s.error:
+            CHAT_ERRORS.inc(intent)
+
+
+tracing.add_span_listener(_observe_span)
@@ -0,0 +1,262 @@
+"""
+Parcel shipper workbooks.
+
+The template (with the logo already placed) is read once and kept in memory as
+xlsx bytes, keyed by the template and logo modification times so edits on disk
+are picked up. Each shipper is loaded from those bytes, filled in and saved to a
+BytesIO; nothing is written to disk.
+
+    RI_PARCEL_TEMPLATE   path to Parcel_Shipper_Template.xlsx
+    RI_PARCEL_LOGO       path to the logo placed at F3 (skipped if missing)
+
+A parsed Workbook can't simply be deep-copied per request: openpyxl's copies
+share style tables and save corrupt files, so the cache holds bytes instead.
+
+stream_parcel_zip() fills many shippers in a process pool and streams them back
+as one ZIP, with a manifest.csv recording each retailer's outcome and timing. The
+pool is shared by all bulk requests and started once at app startup
+(start_parcel_pool), like the chart renderer; each worker parses the template
+when it starts.
+
+    RI_PARCEL_WORKERS    processes for bulk generation (default: CPU count)
+"""
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.drawing.image import Image
+
+PARCEL_TEMPLATE = os.environ.get("RI_PARCEL_TEMPLATE", "/Users/phood/Template/Parcel_Shipper_Template.xlsx")
+PARCEL_LOGO = os.environ.get("RI_PARCEL_LOGO", "/Users/phood/Template/Logo/Picture1.png")
+LOGO_ANCHOR = "F3"
+PARCEL_WORKERS = int(os.environ.get("RI_PARCEL_WORKERS", "0")) or os.cpu_count()
+
+logger = logging.getLogger(__name__)
+
+_template_cache = {}
+_template_lock = threading.Lock()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def template_bytes(template_path=PARCEL_TEMPLATE, logo_path=PARCEL_LOGO):
+    """The prepared template as xlsx bytes, or None if the template file is missing."""
+    template_mtime = _mtime(template_path)
+    if template_mtime is None:
+        return None
+
+    key = (template_path, template_mtime, logo_path, _mtime(logo_path))
+    with _template_lock:
+        cached = _template_cache.get(template_path)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        wb = load_workbook(template_path)
+        ws = wb.active
+        if key[3] is not None and not ws._images:
+            img = Image(logo_path)
+            img.anchor = LOGO_ANCHOR
+            ws.add_image(img)
+
+        buf = BytesIO()
+        wb.save(buf)
+        _template_cache[template_path] = (key, buf.getvalue())
+        return buf.getvalue()
+
+
+def shipment_text(row, use_equipment_on_file=True, manual_items=None):
+    if use_equipment_on_file is False:
+        return manual_items or "Manual shipment"
+    return f"Trupad {row['ipad_number']} and {row['sensor_serial']}"
+
+
+def parcel_filename(retailer):
+    retailer_safe = re.sub(r'[^a-zA-z0-9_-]', '_', retailer)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"parcel_{retailer_safe}_{timestamp}.xlsx"
+
+
+def fill_parcel_shipper(row, shipping_method="Ground", contents=None, template=None):
+    """
+    Fill a shipper for one customer-info row (a dict or Series).
+    Returns (BytesIO positioned at 0, download filename). Raises FileNotFoundError
+    if the template is missing.
+    """
+    template = template or template_bytes()
+    if template is None:
+        raise FileNotFoundError(PARCEL_TEMPLATE)
+
+    wb = load_workbook(BytesIO(template))
+    ws = wb.active
+
+    #==== map the cells ===
+    ws["B9"] = datetime.now().strftime("%m/%d/%Y")
+    ws["G9"] = row['retailer']
+    ws["G10"] = ws["G10"].value + f" {row['fitter']}"
+    ws["G11"] = row['street']
+
+    zip_code = str(int(float(row['zip_code']))) if pd.notna(row['zip_code']) else ""
+
+    ws["G12"] = f"{row['city']}, {row['state']} {zip_code}"
+    ws["G13"] = row['country']
+    ws["B19"] = ws["B19"].value + f" {row['account_number']}"
+
+    ws["B23"] = f"{ws['B23'].value} {contents or shipment_text(row)}"
+    ws["C30"] = "X"
+    ws["B32"] = shipping_method
+    ws["B33"] = "NO"
+
+    buf = BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return buf, parcel_filename(str(row['retailer']))
+
+
+def _bulk_worker(row, shipping_method, contents):
+    t0 = time.perf_counter()
+    try:
+        buf, filename = fill_parcel_shipper(row, shipping_method, contents)
+        return filename, buf.getvalue(), time.perf_counter() - t0, None
+    except Exception as e:
+        return None, None, time.perf_counter() - t0, f"{type(e).__name__}: {e}"
+
+
+def _warm_worker():
+    # Parse the template once per worker rather than on its first shipper. A failure
+    # here would break the whole pool, so it is left for the shipper to report.
+    try:
+        template_bytes()
+    except Exception:
+        pass
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PARCEL_WORKERS, initializer=_warm_worker)
+        return _pool
+
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def start_parcel_pool():
+    """
+    Start the bulk-generation processes now rather than on the first bulk request.
+    Called at app startup, next to charts.start_renderer, so the workers are created
+    before the server starts its request threads.
+    """
+    if multiprocessing.parent_process() is not None:
+        return  # imported inside a worker; workers don't get pools of their own
+    _get_pool().submit(int).result()
+
+
+def _submit(*args):
+    pool = _get_pool()
+    try:
+        return pool, pool.submit(*args)
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        pool = _get_pool()
+        return pool, pool.submit(*args)
+
+
+class _ZipSink:
+    """Write-only file object for zipfile; collects bytes until the generator hands them out."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_parcel_zip(jobs):
+    """
+    Yield a ZIP of shippers chunk by chunk as they finish. jobs is a list of dicts:
+    {"label", "row" (customer-info dict, or None), "shipping_method", "contents", "error"}.
+    Jobs with an error (e.g. unknown retailer) are only recorded in manifest.csv, as are
+    shippers lost to a crashed worker; the ZIP always ends with the manifest.
+    """
+    sink = _ZipSink()
+    manifest = [("retailer", "status", "filename", "elapsed_ms", "error")]
+    used_names = set()
+
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        futures = {}
+        try:
+            for job in jobs:
+                if job.get("error"):
+                    manifest.append((job["label"], "failed", "", 0, job["error"]))
+                    continue
+                pool, fut = _submit(_bulk_worker, job["row"], job["shipping_method"], job["contents"])
+                futures[fut] = (job["label"], pool)
+
+            for fut in as_completed(futures):
+                label, pool = futures[fut]
+                try:
+                    filename, data, elapsed, error = fut.result()
+                except BrokenProcessPool as e:
+                    logger.warning("Parcel worker crashed while generating %s; restarting the pool", label)
+                    _reset_pool(pool)
+                    manifest.append((label, "failed", "", 0, f"{type(e).__name__}: {e}"))
+                    continue
+                if error:
+                    manifest.append((label, "failed", "", round(elapsed * 1000), error))
+                    continue
+
+                # Same retailer twice in one second would collide on the timestamped name
+                stem, n = filename[:-len(".xlsx")], 1
+                while filename in used_names:
+                    n += 1
+                    filename = f"{stem}_{n}.xlsx"
+                used_names.add(filename)
+
+                zf.writestr(filename, data)
+                manifest.append((label, "ok", filename, round(elapsed * 1000), ""))
+                yield sink.drain()
+        finally:
+            # Client went away: drop this request's queued shippers, leave the shared pool running
+            for fut in futures:
+                fut.cancel()
+
+        text = io.StringIO()
+        csv.writer(text).writerows(manifest)
+        zf.writestr("manifest.csv", text.getvalue())
+
+    yield sink.drain()
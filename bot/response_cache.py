@@ -0,0 +1,71 @@
+"""
+Cache of bot replies for repeat read-only questions.
+
+Agents ask the same things all day ("username and password for <retailer>"), and
+each one runs the whole intent cascade and the fuzzy matchers. Replies to
+read-only intents are cached under (normalized message, role, data version).
+The bot bumps its data version on every retailer or troubleshooting write, so
+stale entries are never matched again; clear() drops them at the same time.
+
+    RI_RESPONSE_CACHE_ITEMS   replies kept (default 512; 0 disables the cache)
+    RI_RESPONSE_CACHE_TTL     seconds a reply stays valid (default 600)
+
+Hit and miss counts are exported as ri_cache_requests_total{cache="response"}.
+"""
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from bot.metrics import CACHE_EVICTIONS, record_cache
+
+RESPONSE_CACHE_ITEMS = int(os.environ.get("RI_RESPONSE_CACHE_ITEMS", "512"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RI_RESPONSE_CACHE_TTL", "600"))
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation ("?" alone is kept)."""
+    text = _SPACE_RE.sub(" ", str(text).lower()).strip()
+    return text.rstrip("?!. ") or text
+
+
+class ResponseCache:
+    """LRU with per-entry expiry. Values are deep-copied in and out so callers can't alter them."""
+
+    def __init__(self, max_items=RESPONSE_CACHE_ITEMS, ttl=RESPONSE_CACHE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record_cache("response", entry is not None)
+        return copy.deepcopy(entry[1]) if entry is not None else None
+
+    def put(self, key, value):
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                CACHE_EVICTIONS.inc("response")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
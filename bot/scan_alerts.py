@@ -0,0 +1,302 @@
+"""
+Incremental scan anomaly detection.
+
+Each retailer keeps a running EWMA mean and variance of its monthly scan counts in
+scan_stats, plus the count for the month in progress. When a month closes (a scan
+from a later month arrives, or the calendar has moved on) the closed month is
+compared with the running stats and folded in. Closed months far below or above
+expectation are written to scan_alerts.
+
+scan_events is the only input: tick() folds the rows added since its rowid
+watermark, so the stats always describe the same table that history, forecasts
+and fleet reports read. Work per retailer-month is one primary-key read and
+write; no history is rescanned after the first tick, which seeds the stats from
+the monthly aggregates once.
+
+    python -m bot.scan_alerts --db retailers.db    # run a tick from cron
+"""
+import argparse
+import math
+import sqlite3
+import sys
+
+import pandas as pd
+
+ALPHA = 0.3               # EWMA weight of the newest month
+Z_THRESHOLD = 2.5         # |z| at which a closed month raises an alert
+MIN_MONTHS = 4            # closed months of stats needed before alerting
+MIN_MEAN = 2.0            # don't call drops for retailers averaging fewer scans than this
+MAX_GAP_MONTHS = 24       # empty months folded per close; the EWMA has converged by then
+
+ALERT_DROP = "drop"
+ALERT_SPIKE = "spike"
+
+
+def _ym(value):
+    return pd.Timestamp(value).strftime("%Y-%m")
+
+
+def _next_ym(ym):
+    year, month = int(ym[:4]), int(ym[5:7])
+    return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def _months_between(a, b):
+    return (int(b[:4]) - int(a[:4])) * 12 + int(b[5:7]) - int(a[5:7])
+
+
+class ScanAnomalyDetector:
+    def __init__(self, conn, alpha=ALPHA, z_threshold=Z_THRESHOLD):
+        self.conn = conn
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self._ensure_tables()
+
+    def _ensure_tables(self):
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scan_stats (
+                retailer_key TEXT PRIMARY KEY,
+                retailer TEXT NOT NULL,
+                current_month TEXT NOT NULL,
+                current_count INTEGER NOT NULL DEFAULT 0,
+                mean REAL NOT NULL DEFAULT 0,
+                var REAL NOT NULL DEFAULT 0,
+                months INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scan_alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                retailer TEXT NOT NULL,
+                month TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                observed INTEGER NOT NULL,
+                expected REAL NOT NULL,
+                zscore REAL NOT NULL,
+                acknowledged INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (retailer, month, kind)
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_scan_alerts_open ON scan_alerts(acknowledged, created_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_scan_alerts_retailer ON scan_alerts(retailer COLLATE NOCASE, month)")
+        # Single-row bookmark: the last scan_events rowid folded into scan_stats
+        cur.execute("CREATE TABLE IF NOT EXISTS scan_stats_watermark (id INTEGER PRIMARY KEY CHECK (id = 1), last_rowid INTEGER NOT NULL)")
+        self.conn.commit()
+
+    # ---- stats ----
+
+    def _fold(self, state, observed, month, alerts):
+        """Compare a closed month with the running stats, then fold it in."""
+        mean, var, months = state["mean"], state["var"], state["months"]
+
+        if months >= MIN_MONTHS:
+            # Poisson floor keeps near-constant retailers from alerting on tiny wobbles
+            sd = max(math.sqrt(var), math.sqrt(mean), 1.0)
+            z = (observed - mean) / sd
+            if z <= -self.z_threshold and mean >= MIN_MEAN:
+                alerts.append((state["retailer"], month, ALERT_DROP, observed, round(mean, 2), round(z, 2)))
+            elif z >= self.z_threshold:
+                alerts.append((state["retailer"], month, ALERT_SPIKE, observed, round(mean, 2), round(z, 2)))
+
+        if months == 0:
+            state["mean"], state["var"] = float(observed), 0.0
+        else:
+            diff = observed - mean
+            incr = self.alpha * diff
+            state["mean"] = mean + incr
+            state["var"] = (1 - self.alpha) * (var + diff * incr)
+        state["months"] = months + 1
+
+    def _advance(self, state, month, alerts):
+        """Close the open month and any empty months before `month`, which becomes the open month."""
+        gap = _months_between(state["current_month"], month)
+        if gap <= 0:
+            return
+
+        self._fold(state, state["current_count"], state["current_month"], alerts)
+        empty = state["current_month"]
+        skipped = max(0, gap - 1 - MAX_GAP_MONTHS)
+        for _ in range(skipped + 1):
+            empty = _next_ym(empty)
+        for _ in range(gap - 1 - skipped):
+            self._fold(state, 0, empty, alerts)
+            empty = _next_ym(empty)
+
+        state["current_month"] = month
+        state["current_count"] = 0
+
+    def _load(self, key):
+        cur = self.conn.cursor()
+        cur.execute(
+            "SELECT retailer, current_month, current_count, mean, var, months FROM scan_stats WHERE retailer_key = ?",
+            (key,),
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip(("retailer", "current_month", "current_count", "mean", "var", "months"), row))
+
+    def _save(self, key, state):
+        self.conn.execute(
+            """
+            INSERT OR REPLACE INTO scan_stats
+                (retailer_key, retailer, current_month, current_count, mean, var, months, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            (key, state["retailer"], state["current_month"], state["current_count"], state["mean"], state["var"], state["months"]),
+        )
+
+    def _write_alerts(self, alerts):
+        self.conn.executemany(
+            """
+            INSERT OR IGNORE INTO scan_alerts (retailer, month, kind, observed, expected, zscore)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            alerts,
+        )
+
+    def _apply(self, retailer, month, count, alerts):
+        key = retailer.strip().lower()
+        state = self._load(key)
+        if state is None:
+            state = {"retailer": retailer.strip(), "current_month": month, "current_count": 0, "mean": 0.0, "var": 0.0, "months": 0}
+
+        self._advance(state, month, alerts)
+        if month == state["current_month"]:
+            state["current_count"] += count
+        # Events for months that already closed are late arrivals; the EWMA can't take them back
+
+        self._save(key, state)
+
+    # ---- batch paths ----
+
+    def _watermark(self):
+        row = self.conn.execute("SELECT last_rowid FROM scan_stats_watermark WHERE id = 1").fetchone()
+        return row[0] if row else None
+
+    def _set_watermark(self, rowid):
+        self.conn.execute("INSERT OR REPLACE INTO scan_stats_watermark (id, last_rowid) VALUES (1, ?)", (rowid,))
+
+    def _seed(self):
+        """First run only: build the stats from monthly aggregates of the whole history."""
+        cur = self.conn.cursor()
+        max_rowid = cur.execute("SELECT COALESCE(MAX(rowid), 0) FROM scan_events").fetchone()[0]
+        cur.execute(
+            """
+            SELECT LOWER(retailer), MIN(retailer), strftime('%Y-%m', scan_date) AS ym, COUNT(*)
+            FROM scan_events
+            WHERE rowid <= ? AND retailer IS NOT NULL AND TRIM(retailer) != '' AND ym IS NOT NULL
+            GROUP BY 1, 3
+            ORDER BY 1, 3
+            """,
+            (max_rowid,),
+        )
+        with self.conn:
+            key, state = None, None
+            for rkey, name, month, count in cur.fetchall():
+                if rkey != key:
+                    if state is not None:
+                        self._save(key, state)
+                    key = rkey
+                    state = {"retailer": name, "current_month": month, "current_count": 0, "mean": 0.0, "var": 0.0, "months": 0}
+                # History is already known, so seeding doesn't raise alerts for it
+                self._advance(state, month, [])
+                state["current_count"] += count
+            if state is not None:
+                self._save(key, state)
+            self._set_watermark(max_rowid)
+
+    def tick(self, today=None):
+        """
+        Periodic pass: fold scan_events rows added since the last tick, then close
+        out months that have ended for retailers with no newer scans.
+        Returns the alerts raised.
+        """
+        if self._watermark() is None:
+            self._seed()
+
+        alerts = []
+        with self.conn:
+            cur = self.conn.cursor()
+            cur.execute(
+                """
+                SELECT MIN(retailer), strftime('%Y-%m', scan_date) AS ym, COUNT(*), MAX(rowid)
+                FROM scan_events
+                WHERE rowid > ? AND retailer IS NOT NULL AND TRIM(retailer) != '' AND ym IS NOT NULL
+                GROUP BY LOWER(retailer), ym
+                ORDER BY ym
+                """,
+                (self._watermark(),),
+            )
+            new = cur.fetchall()
+            for retailer, month, count, _ in new:
+                self._apply(retailer, month, count, alerts)
+            if new:
+                self._set_watermark(max(r[3] for r in new))
+
+            this_month = _ym(today or pd.Timestamp.today())
+            cur.execute("SELECT retailer_key FROM scan_stats WHERE current_month < ?", (this_month,))
+            for (key,) in cur.fetchall():
+                state = self._load(key)
+                self._advance(state, this_month, alerts)
+                self._save(key, state)
+
+            self._write_alerts(alerts)
+        return alerts
+
+    # ---- reading alerts ----
+
+    def open_alerts(self, limit=20):
+        return pd.read_sql_query(
+            """
+            SELECT id, retailer, month, kind, observed, expected, zscore, created_at
+            FROM scan_alerts
+            WHERE acknowledged = 0
+            ORDER BY created_at DESC, ABS(zscore) DESC
+            LIMIT ?
+            """,
+            self.conn,
+            params=[int(limit)],
+        )
+
+    def acknowledge(self, alert_ids):
+        with self.conn:
+            self.conn.executemany("UPDATE scan_alerts SET acknowledged = 1 WHERE id = ?", ((int(i),) for i in alert_ids))
+
+    def format_alerts(self, df):
+        if df.empty:
+            return "No open scan alerts."
+        lines = []
+        for row in df.itertuples():
+            month = pd.Timestamp(row.month + "-01").strftime("%b %Y")
+            word = "dropped to" if row.kind == ALERT_DROP else "jumped to"
+            lines.append(f"{row.retailer}: scans {word} {row.observed} in {month} (usually ~{row.expected:.0f})")
+        return "Open scan alerts:\n" + "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fold new scans into scan_stats and raise scan_alerts.")
+    parser.add_argument("--db", default="retailers.db", help="path to retailers.db")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    try:
+        alerts = ScanAnomalyDetector(conn).tick()
+    finally:
+        conn.close()
+
+    for retailer, month, kind, observed, expected, z in alerts:
+        print(f"{retailer:<40} {month}  {kind:<5} observed={observed} expected={expected:g} z={z:g}")
+    print(f"{len(alerts)} new alerts")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
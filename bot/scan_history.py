@@ -1,12 +1,58 @@
-import matplotlib.pyplot as plt
+import logging
+
 import pandas as pd
-from io import BytesIO
-import base64
+from bot.charts import chart_url, line_chart_spec
+from bot.tracing import span
+
+logger = logging.getLogger(__name__)
 
 
 class ScanHistory:
     def __init__(self, conn):
         self.conn = conn
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        # Matches the LOWER(retailer) = ? AND scan_date range lookups below
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_scan_events_retailer_date ON scan_events(LOWER(retailer), scan_date)")
+        self.conn.commit()
+
+    @staticmethod
+    def _month(value):
+        return pd.Timestamp(value).strftime("%Y-%m")
+
+    def monthly_series(self, retailer, start=None, end=None):
+        """
+        Monthly scan counts for a retailer from one query: columns day (month start)
+        and count, one row per month from start (default: first scan month) to end
+        (default: this month), with empty months filled as 0 by the database.
+        """
+        start_month = self._month(start) if start is not None else None
+        end_month = self._month(end if end is not None else pd.Timestamp.today())
+        after_end = self._month(pd.Timestamp(end_month + "-01") + pd.DateOffset(months=1))
+
+        query = """
+        WITH RECURSIVE
+            counts AS (
+                SELECT strftime('%Y-%m', scan_date) AS ym, COUNT(*) AS count
+                FROM scan_events
+                WHERE LOWER(retailer) = ? AND scan_date >= ? AND scan_date < ?
+                GROUP BY ym
+            ),
+            months(ym) AS (
+                SELECT COALESCE(?, (SELECT MIN(ym) FROM counts))
+                UNION ALL
+                SELECT strftime('%Y-%m', ym || '-01', '+1 month') FROM months WHERE ym < ?
+            )
+        SELECT months.ym || '-01' AS day, COALESCE(counts.count, 0) AS count
+        FROM months LEFT JOIN counts ON counts.ym = months.ym
+        WHERE months.ym IS NOT NULL
+        ORDER BY months.ym
+        """
+        params = [retailer.strip().lower(), (start_month or "0000-01") + "-01", after_end + "-01", start_month, end_month]
+        with span("sql", query="monthly_series"):
+            df = pd.read_sql_query(query, self.conn, params=params, parse_dates=["day"])
+        return df
 
     def scans_in_range(self, retailer, start=None, end=None):
         retailer_clean = retailer.strip().lower()
@@ -31,70 +77,44 @@ class ScanHistory:
             params.append(end)
 
         query += " GROUP BY day ORDER BY day"
-        df = pd.read_sql_query(query, self.conn, params=params)
-        print("DEBUG SCANS QUERY:", query)
-        print("DEBUG PARAMS:", params)
-        print("DEBUG SCANS DF:", df)
+        with span("sql", query="scans_in_range"):
+            df = pd.read_sql_query(query, self.conn, params=params)
+        logger.debug("scans_in_range %s %s -> %d rows", query, params, len(df))
         return df
     
     def scans_last_n_months(self, retailer, n):
         start = (pd.Timestamp.today().replace(day=1) - pd.DateOffset(months=n))
-        return self.scans_in_range(retailer, start)
+        return self.monthly_series(retailer, start)
     
     def scans_n_months_ago(self, retailer, n):
-        start = (pd.Timestamp.today().replace(day=1) - pd.DateOffset(month=n))
-        end = start + pd.DateOffset(month=1)
-        df = self.scans_in_range(retailer, start, end)
+        month = (pd.Timestamp.today().replace(day=1) - pd.DateOffset(months=n))
+        df = self.monthly_series(retailer, month, month)
         return int(df["count"].sum())
     
     def scans_full_history(self, retailer):
-        return self.scans_in_range(retailer)
+        return self.monthly_series(retailer)
     
     def scans_this_year(self, retailer):
         start = pd.Timestamp.today().replace(month=1, day=1)
-        return self.scans_in_range(retailer, start)
+        return self.monthly_series(retailer, start)
     
     def scans_monthly_history(self, retailer):
         df = self.scans_full_history(retailer)
 
         if df.empty:
             return None
-        
-        df["day"] = pd.to_datetime(df["day"])
-
-        monthly = (
-            df.set_index("day").resample("MS").sum().reset_index()
-        )
 
-        return monthly
+        return df
     
     def format_monthly_counts(self, df):
         return "\n".join(f"{row['day'].strftime('%b %Y')}: {int(row['count'])}" for _, row in df.iterrows()) 
     
-    def plot_scan_history(self, df, retailer, title="Scan History"):
-        if df.empty:
-            return None
-        
-        df['day'] = pd.to_datetime(df['day'])
-        df_monthly = (df.set_index('day').resample('M').sum().reset_index())
-
-        plt.figure(figsize=(8, 4.5))
-        plt.plot(df_monthly['day'], df_monthly['count'], linewidth=2.5, marker='o', markersize=6, linestyle='-', color='green')
-        plt.title(f"{title} for {retailer}", fontsize=14, fontweight="bold", pad=12)
-        plt.xlabel("Month", fontsize=11, labelpad=8)
-        plt.ylabel("Number of Scans", fontsize=11, labelpad=8)
-        plt.grid(axis="y", linestyle="--", linewidth=0.6, alpha=0.5)
-        ax = plt.gca()
-        ax.spines["top"].set_visible(False)
-        ax.spines["right"].set_visible(False)
-        months = df_monthly['day'].dt.strftime("%b")
-        plt.xticks(df_monthly['day'], months, rotation=45, ha="right")
-
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=200)
-        plt.close()
-        buffer.seek(0)
-        img_base64 = base64.b64encode(buffer.read()).decode('utf-8')
-        return f"data:image/png;base64,{img_base64}"
+    def chart_spec(self, df_monthly, retailer, title="Scan History"):
+        return line_chart_spec(df_monthly["day"], df_monthly["count"], f"{title} for {retailer}", "Number of Scans")
 
+    def plot_scan_history(self, df_monthly, retailer, title="Scan History"):
+        """Chart a monthly_series() result."""
+        if df_monthly.empty:
+            return None
 
+        return chart_url(self.chart_spec(df_monthly, retailer, title))
@@ -1,16 +1,131 @@
-import matplotlib
-matplotlib.use("Agg")
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
-from prophet import Prophet
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
+import json
+from dataclasses import dataclass
+from bot.charts import chart_response, chart_url, line_chart_spec
+from bot.forecasters import get_forecaster
+from bot.metrics import record_cache
+from bot.tracing import annotate, span
+
+# Bump whenever the forecasting logic changes so cached forecasts are recomputed
+MODEL_VERSION = "2"
+
+@dataclass
+class MonthlyMatrix:
+    """
+    Monthly scan counts for every retailer: counts[i, j] is retailer i in month j.
+    Columns run from the earliest scan month to end_month; rows are zero before each
+    retailer's first month and lengths[i] counts the months from there to end_month.
+    """
+    keys: list
+    retailers: list
+    months: pd.DatetimeIndex
+    counts: np.ndarray
+    lengths: np.ndarray
+    latest_scan_dates: list
+    event_counts: np.ndarray
+
+    @property
+    def end_month(self):
+        return self.months[-1]
+
 
 class ScanPredictor:
-    def __init__(self, conn):
+    def __init__(self, conn, engine=None):
+        """engine: forecasting engine name (see bot.forecasters.ENGINES); defaults to RI_FORECAST_ENGINE."""
         self.conn = conn
+        self.forecaster = get_forecaster(engine)
+        self._ensure_cache_table()
+
+    def _forecaster(self, engine=None):
+        return get_forecaster(engine) if engine else self.forecaster
+
+    def model_version(self, engine=None):
+        return f"{MODEL_VERSION}:{self._forecaster(engine).name}"
+
+    def _ensure_cache_table(self):
+        """
+        One cached forecast per retailer and horizon. A row is only valid while its
+        inputs match: same forecast start month, same latest scan date and event count
+        for the retailer, same MODEL_VERSION and engine.
+        """
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS forecast_cache (
+                retailer TEXT NOT NULL,
+                horizon INTEGER NOT NULL,
+                start_month TEXT NOT NULL,
+                latest_scan_date TEXT,
+                event_count INTEGER NOT NULL,
+                model_version TEXT NOT NULL,
+                predictions TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (retailer, horizon)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def data_fingerprint(self, retailer):
+        """(latest scan date, event count) for a retailer; changes whenever new scans arrive."""
+        cur = self.conn.cursor()
+        cur.execute(
+            "SELECT MAX(scan_date), COUNT(*) FROM scan_events WHERE LOWER(retailer) = ?",
+            (retailer.lower(),),
+        )
+        latest, count = cur.fetchone()
+        return (str(latest) if latest is not None else None), int(count or 0)
+
+    def get_cached_forecast(self, retailer, horizon, start_month, fingerprint, engine=None):
+        """
+        A forecast for a shorter horizon is a prefix of a longer one, so any valid row
+        with horizon >= the requested one will do (e.g. the nightly 12-month run).
+        """
+        latest, count = fingerprint
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            SELECT predictions
+            FROM forecast_cache
+            WHERE retailer = ?
+              AND horizon >= ?
+              AND start_month = ?
+              AND latest_scan_date IS ?
+              AND event_count = ?
+              AND model_version = ?
+            ORDER BY horizon
+            LIMIT 1
+            """,
+            (retailer.lower(), int(horizon), start_month.strftime("%Y-%m-%d"), latest, count, self.model_version(engine)),
+        )
+        row = cur.fetchone()
+        if not row:
+            return None
+
+        points = json.loads(row[0])[:int(horizon)]
+        predictions = pd.DataFrame({
+            "ds": pd.to_datetime([p[0] for p in points]),
+            "predicted_scan_count": [p[1] for p in points],
+        })
+        predictions["retailer"] = retailer
+        return predictions
+
+    def store_forecast(self, retailer, horizon, start_month, fingerprint, predictions, engine=None):
+        latest, count = fingerprint
+        points = [
+            [ds.strftime("%Y-%m-%d"), float(v)]
+            for ds, v in zip(predictions["ds"], predictions["predicted_scan_count"])
+        ]
+        self.conn.execute(
+            """
+            INSERT OR REPLACE INTO forecast_cache
+                (retailer, horizon, start_month, latest_scan_date, event_count, model_version, predictions, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            (retailer.lower(), int(horizon), start_month.strftime("%Y-%m-%d"), latest, count, self.model_version(engine), json.dumps(points)),
+        )
+        self.conn.commit()
 
     def retailer_exists(self, retailer):
         query = "SELECT 1 FROM retailers WHERE LOWER(retailer) = ? LIMIT 1"
@@ -24,7 +139,8 @@ class ScanPredictor:
         FROM scan_events
         WHERE LOWER(retailer) = ?
         """
-        df = pd.read_sql_query(query, self.conn, params=(retailer.lower(),))
+        with span("sql", query="historical_scans"):
+            df = pd.read_sql_query(query, self.conn, params=(retailer.lower(),))
         if df.empty:
             return pd.DataFrame()
 
@@ -47,110 +163,171 @@ class ScanPredictor:
 
 
     
-    def predict_scans(self, retailer, months=12):
-        forecast_months = pd.date_range(
-            pd.Timestamp.today().replace(day=1),
-            periods=12,
-            freq="MS"
-        )
+    def predict_scans(self, retailer, months=12, use_cache=True, engine=None):
+        """
+        Forecast for a retailer, served from forecast_cache while the retailer's scan
+        data is unchanged; recomputed (and re-cached) once new scans arrive.
+        engine overrides the predictor's default forecasting engine for this call.
+        """
+        if use_cache:
+            cached = self.get_cached_forecast(retailer, months, self.forecast_start(), self.data_fingerprint(retailer), engine)
+            annotate(forecast_cache="hit" if cached is not None else "miss")
+            record_cache("forecast", cached is not None)
+            if cached is not None:
+                return cached
 
-        data = self.get_historical_scans(retailer)
-        print(data)
-        n_months = len(data)
-        if n_months == 0:
-            return pd.DataFrame({
-                "ds": forecast_months,
-                "predicted_scan_count": [0]*len(forecast_months)
-            })
+        start_month, fingerprint, predictions = self.compute_forecast(retailer, months, engine)
+        self.store_forecast(retailer, months, start_month, fingerprint, predictions, engine)
+        return predictions
 
-       
-        rolling_avg = data["scan_count"].rolling(window=min(3, n_months), min_periods=1).mean().iloc[-1]
-
-        # Activity factor
-        real_data = data[data["scan_count"] > 0]
-        latest_date = real_data["ds"].max()
-        months_since_last_scan = (pd.Timestamp.today() - latest_date).days / 30.44
-
-        scans_last_6m = real_data.loc[
-            real_data["ds"] >= latest_date - pd.DateOffset(month=6), "scan_count"
-        ].sum()
-
-        avg_scans_per_month = real_data["scan_count"].mean()
-
-        if avg_scans_per_month >= 2 or scans_last_6m >= 4:
-            activity_factor = 1.0
-        elif scans_last_6m >= 2:
-            activity_factor = 0.8
-        elif months_since_last_scan <= 3:
-            activity_factor = 0.5
-        elif months_since_last_scan <= 6:
-            activity_factor = 0.3
-        else:
-            activity_factor = 0.3
-
-        
-        predictions = None
-
-        if n_months >= 12:
-            try:
-                prophet_data = data.rename(columns={"scan_count":"y"})[["ds","y"]]
-                m = Prophet(yearly_seasonality=True, weekly_seasonality=False, daily_seasonality=False)
-                m.fit(prophet_data)
-
-                future = pd.DataFrame({"ds": forecast_months})
-                forecast = m.predict(future)
-                forecast["yhat"] = (0.7 * forecast["yhat"] + 0.3 * rolling_avg)
-                forecast["yhat"] = np.clip(forecast["yhat"], 0, max(2*rolling_avg, 1))
-                forecast["yhat"] *= activity_factor
-                forecast["yhat"] = forecast["yhat"].round()
-
-                predictions = forecast[["ds","yhat"]].rename(columns={"yhat":"predicted_scan_count"})
-
-            except Exception as e:
-               
-                predictions = pd.DataFrame({
-                    "ds": forecast_months,
-                    "predicted_scan_count": np.round(rolling_avg * activity_factor)
-                })
+    @staticmethod
+    def forecast_start():
+        return pd.Timestamp.today().normalize().replace(day=1)
+
+    def compute_forecast(self, retailer, months=12, engine=None):
+        """
+        Fit and predict without touching the cache.
+        Returns (start_month, fingerprint, predictions) so the caller can store it;
+        the fingerprint is taken before reading history so newer scans invalidate the result.
+        """
+        start_month = self.forecast_start()
+        fingerprint = self.data_fingerprint(retailer)
+        predictions = self._compute_forecast(retailer, start_month, months, self._forecaster(engine))
+        return start_month, fingerprint, predictions
+
+    def _compute_forecast(self, retailer, start_month, months, forecaster):
+        forecast_months = pd.date_range(start_month, periods=months, freq="MS")
+
+        data = self.get_historical_scans(retailer)
+        if data.empty:
+            values = np.zeros(len(forecast_months))
         else:
-           
-            predictions = pd.DataFrame({
-                "ds": forecast_months,
-                "predicted_scan_count": np.round(rolling_avg * activity_factor)
-            })
+            history = data["scan_count"].to_numpy(dtype=float)
+            end_month = data["ds"].iloc[-1]
+            # Column index of the first forecast month; history normally ends at the current month
+            first_step = len(history) - 1 + (start_month.year - end_month.year) * 12 + (start_month.month - end_month.month)
+            with span("forecast_fit", engine=forecaster.name, history_months=len(history)):
+                values = forecaster.forecast(history, [len(history)], first_step, months, end_month)[0]
 
+        predictions = pd.DataFrame({
+            "ds": forecast_months,
+            "predicted_scan_count": values,
+        })
         predictions["retailer"] = retailer
         return predictions
 
-    def generate_graph(self, retailer, predictions):
-        plt.figure(figsize=(8,4.5))
-        plt.plot(predictions["ds"], predictions["predicted_scan_count"], linewidth=2.5, marker='o', markersize=6, linestyle='-', color='green')
-        plt.title(f"Predicted Scans for {retailer}", fontsize=14, fontweight="bold", pad=12)
-        plt.xlabel("Month", fontsize=11, labelpad=8)
-        plt.ylabel("Scan Count", fontsize=11, labelpad=8)
-        months = predictions["ds"].dt.strftime("%b")
-        plt.grid(axis="y", linestyle="--", linewidth=0.6, alpha=0.5)
-        ax = plt.gca()
-        ax.spines["top"].set_visible(False)
-        ax.spines["right"].set_visible(False)
-        plt.xticks(predictions["ds"], months, rotation=45, ha="right")
-        plt.tight_layout()
-
-        buf = BytesIO()
-        plt.savefig(buf, format="png")
-        plt.close()
-        buf.seek(0)
-        img_base64 = base64.b64encode(buf.read()).decode("utf-8")
-        return f"data:image/png;base64,{img_base64}"
-    
-    def predict_scans_with_graph(self, retailer, months=12):
-        predictions = self.predict_scans(retailer, months)
+    def monthly_matrix(self, end_month=None):
+        """
+        Load every retailer's monthly counts with one grouped query and scatter them
+        into a dense retailers x months matrix.
+        """
+        end_month = pd.Timestamp(end_month or self.forecast_start())
+        end_ord = end_month.year * 12 + end_month.month - 1
+
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            SELECT LOWER(retailer), MIN(retailer), strftime('%Y-%m', scan_date), COUNT(*), MAX(scan_date)
+            FROM scan_events
+            WHERE retailer IS NOT NULL AND TRIM(retailer) != ''
+            GROUP BY 1, 3
+            """
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return MonthlyMatrix([], [], pd.DatetimeIndex([end_month]), np.zeros((0, 1)),
+                                 np.zeros(0, dtype=int), [], np.zeros(0, dtype=int))
+
+        rkeys, names, yms, scan_counts, latest = zip(*rows)
+        keys, row_idx = np.unique(np.array(rkeys, dtype=object), return_inverse=True)
+        scan_counts = np.array(scan_counts)
+
+        # Fingerprints cover every row, matching data_fingerprint()
+        event_counts = np.bincount(row_idx, weights=scan_counts, minlength=len(keys)).astype(int)
+        retailers = [None] * len(keys)
+        latest_dates = [None] * len(keys)
+        for i, name, last in zip(row_idx, names, latest):
+            if retailers[i] is None or name < retailers[i]:
+                retailers[i] = name
+            if last is not None and (latest_dates[i] is None or str(last) > latest_dates[i]):
+                latest_dates[i] = str(last)
 
-        predictions = predictions.head(months)
+        # Unparseable dates have no month; scans after end_month aren't history yet
+        ords = np.array([int(ym[:4]) * 12 + int(ym[5:7]) - 1 if ym else -1 for ym in yms])
+        keep = (ords >= 0) & (ords <= end_ord)
+        start_ord = int(ords[keep].min()) if keep.any() else end_ord
+        n_months = end_ord - start_ord + 1
 
-        image = self.generate_graph(retailer, predictions)
+        counts = np.zeros((len(keys), n_months))
+        np.add.at(counts, (row_idx[keep], ords[keep] - start_ord), scan_counts[keep])
+
+        first_ord = np.full(len(keys), end_ord)
+        np.minimum.at(first_ord, row_idx[keep], ords[keep])
+
+        return MonthlyMatrix(
+            keys=list(keys),
+            retailers=retailers,
+            months=pd.date_range(end=end_month, periods=n_months, freq="MS"),
+            counts=counts,
+            lengths=end_ord - first_ord + 1,
+            latest_scan_dates=latest_dates,
+            event_counts=event_counts,
+        )
+
+    def predict_fleet(self, months=12, engine=None, persist=False):
+        """
+        Forecast every retailer at once: one query, one matrix, array operations
+        for the rolling averages, activity factors and model. Returns a long
+        DataFrame (retailer, ds, predicted_scan_count); persist=True also writes
+        every forecast into forecast_cache in one transaction.
+        """
+        forecaster = self._forecaster(engine)
+        start_month = self.forecast_start()
+        matrix = self.monthly_matrix(end_month=start_month)
+        forecast_months = pd.date_range(start_month, periods=months, freq="MS")
+
+        if not matrix.keys:
+            return pd.DataFrame(columns=["retailer", "ds", "predicted_scan_count"])
+
+        values = forecaster.forecast(
+            matrix.counts, matrix.lengths, matrix.counts.shape[1] - 1, months, matrix.end_month
+        )
+
+        if persist:
+            start = start_month.strftime("%Y-%m-%d")
+            month_strs = forecast_months.strftime("%Y-%m-%d")
+            version = self.model_version(engine)
+            with self.conn:
+                self.conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO forecast_cache
+                        (retailer, horizon, start_month, latest_scan_date, event_count, model_version, predictions, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    """,
+                    (
+                        (key, int(months), start, latest, int(count), version,
+                         json.dumps([[m, float(v)] for m, v in zip(month_strs, row)]))
+                        for key, latest, count, row in zip(matrix.keys, matrix.latest_scan_dates, matrix.event_counts, values)
+                    ),
+                )
+
+        return pd.DataFrame({
+            "retailer": np.repeat(matrix.retailers, months),
+            "ds": np.tile(forecast_months, len(matrix.retailers)),
+            "predicted_scan_count": values.ravel(),
+        })
+
+    def chart_spec(self, retailer, predictions):
+        return line_chart_spec(predictions["ds"], predictions["predicted_scan_count"], f"Predicted Scans for {retailer}", "Scan Count")
+
+    def generate_graph(self, retailer, predictions):
+        return chart_url(self.chart_spec(retailer, predictions))
+    
+    def predict_scans_with_graph(self, retailer, months=12, engine=None, chart_mode=None):
+        """Predictions plus the chart fields for the reply (see charts.chart_response)."""
+        predictions = self.predict_scans(retailer, months, engine=engine)
 
         return {
             "predictions": predictions,
-            "image": image
+            **chart_response(self.chart_spec(retailer, predictions), chart_mode),
         }
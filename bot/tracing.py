@@ -0,0 +1,157 @@
+"""
+Per-stage latency tracing for the chat pipeline.
+
+A trace is a tree of spans: `with span("find_best_row"):` times a block and nests
+under whatever span is open in the same context (request thread, job, ...). A span
+opened with no parent is the root of a new trace; when it closes the whole tree is
+kept in an in-memory ring buffer (/admin/traces) and, optionally, appended to a
+JSON-lines file. process_input tags the root with the routed intent. Listeners
+registered with add_span_listener see every span as it closes (bot.metrics).
+
+    RI_TRACE_BUFFER   finished traces kept in memory (default 200)
+    RI_TRACE_FILE     also append each trace as one JSON line to this file (default off)
+
+Spans cost two perf_counter calls and a small object; nothing is formatted until a
+trace is read or written.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_BUFFER = int(os.environ.get("RI_TRACE_BUFFER", "200"))
+TRACE_FILE = os.environ.get("RI_TRACE_FILE") or None
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("ri_trace_span", default=None)
+_traces = deque(maxlen=TRACE_BUFFER)
+_lock = threading.Lock()
+_listeners = []
+
+
+class Span:
+    __slots__ = ("name", "attrs", "parent", "children", "started", "_t0", "elapsed", "error")
+
+    def __init__(self, name, attrs, parent):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.elapsed = None
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def root(self):
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "started": round(self.started, 6),
+            "ms": round(self.elapsed * 1000, 3) if self.elapsed is not None else None,
+            "attrs": self.attrs,
+            "error": self.error,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+def _finish(root):
+    with _lock:
+        _traces.append(root)
+    if TRACE_FILE:
+        try:
+            line = json.dumps(root.to_dict(), default=str)
+            with _lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning("Could not write trace to %s: %s", TRACE_FILE, e)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block as a span under the current one (or as the root of a new trace)."""
+    parent = _current.get()
+    s = Span(name, attrs, parent)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.elapsed = time.perf_counter() - s._t0
+        _current.reset(token)
+        for listener in _listeners:
+            try:
+                listener(s)
+            except Exception:
+                logger.exception("Span listener failed")
+        if parent is None:
+            _finish(s)
+        else:
+            parent.children.append(s)
+
+
+def add_span_listener(fn):
+    """Call fn(span) whenever a span closes, on the thread that closed it."""
+    _listeners.append(fn)
+
+
+def traced(name=None):
+    """Decorator form of span(); the span is named after the function by default."""
+    def deco(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def current_span():
+    return _current.get()
+
+
+def annotate(**attrs):
+    """Add attributes to the open span, if any."""
+    s = _current.get()
+    if s is not None:
+        s.attrs.update(attrs)
+
+
+def set_intent(intent):
+    """Tag the current trace's root span with the intent the message was routed to."""
+    s = _current.get()
+    if s is not None:
+        s.root().attrs["intent"] = intent
+
+
+def recent_traces(limit=50, min_ms=0, intent=None):
+    """Finished traces, newest first, as dicts."""
+    with _lock:
+        roots = list(_traces)
+    out = []
+    for root in reversed(roots):
+        if root.elapsed * 1000 < min_ms:
+            continue
+        if intent and root.attrs.get("intent") != intent:
+            continue
+        out.append(root.to_dict())
+        if len(out) >= limit:
+            break
+    return out
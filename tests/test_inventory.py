@@ -0,0 +1,86 @@
+"""
+Inventory status guards: the row factory and the conditional UPDATEs must agree on
+what counts as in-house. Run from the repo root: `python -m pytest tests`.
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bot.inventory import STATUS_ASSIGNED, STATUS_IN_HOUSE, STATUS_RETIRED, InventoryManager
+
+INVENTORY_SCHEMA = """
+CREATE TABLE inventory (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    number TEXT,
+    serial_number TEXT NOT NULL,
+    model TEXT,
+    ios_version TEXT,
+    status TEXT,
+    last_updated TEXT,
+    asset_tag TEXT,
+    location TEXT,
+    assigned_to TEXT,
+    notes TEXT
+)
+"""
+
+
+def _conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(INVENTORY_SCHEMA)
+    return conn
+
+
+def _add(conn, tag, status):
+    conn.execute(
+        "INSERT INTO inventory (type, serial_number, asset_tag, status) VALUES ('iPad', ?, ?, ?)",
+        (f"SN-{tag}", tag, status),
+    )
+    conn.commit()
+
+
+def _status(conn, tag):
+    return conn.execute("SELECT status FROM inventory WHERE asset_tag = ?", (tag,)).fetchone()[0]
+
+
+@pytest.mark.parametrize("legacy", ["inhouse", "In-House", None, "", "  "])
+def test_legacy_statuses_are_migrated_and_can_be_checked_out(legacy):
+    conn = _conn()
+    _add(conn, "A1", legacy)
+    inv = InventoryManager(conn)
+
+    assert _status(conn, "A1") == STATUS_IN_HOUSE
+    ok, msg = inv.check_out("A1", "Walmart")
+    assert ok, msg
+    assert _status(conn, "A1") == STATUS_ASSIGNED
+
+
+@pytest.mark.parametrize("blank", [None, ""])
+def test_blank_status_written_after_startup_can_be_checked_out(blank):
+    conn = _conn()
+    inv = InventoryManager(conn)
+    _add(conn, "A1", blank)
+
+    assert inv.lookup_device("A1").availability_label == "Avaliable"
+    ok, msg = inv.check_out("A1", "Walmart")
+    assert ok, msg
+    assert _status(conn, "A1") == STATUS_ASSIGNED
+
+
+def test_migration_leaves_retired_and_assigned_alone():
+    conn = _conn()
+    _add(conn, "R1", STATUS_RETIRED)
+    _add(conn, "S1", STATUS_ASSIGNED)
+    InventoryManager(conn)
+    InventoryManager(conn)
+
+    assert _status(conn, "R1") == STATUS_RETIRED
+    assert _status(conn, "S1") == STATUS_ASSIGNED